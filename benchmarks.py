@@ -0,0 +1,131 @@
+"""
+Description
+-----------
+Throughput benchmarks for the processing pipeline, run on synthetic run data.
+
+Usage
+-----
+python benchmarks.py read [rows]
+python benchmarks.py render [frames]
+"""
+
+import io
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+from graphical import COLUMNS, SAMPLING, create_video_from_file, parse_run
+
+HEADER = "l_shank_x,l_shank_y,l_shank_z,l_thigh_x,l_thigh_y,l_thigh_z,r_shank_x,r_shank_y,r_shank_z,r_thigh_x,r_thigh_y,r_thigh_z"
+
+
+def synthetic_run(rows: int) -> str:
+    """Text of a .run file with `rows` rows of random angles."""
+    values = np.random.default_rng(0).uniform(-np.pi, np.pi, (rows, COLUMNS))
+    body = io.StringIO()
+    np.savetxt(body, values, delimiter=",", fmt="%.6f")
+    return f"{HEADER}\n{body.getvalue()}"
+
+
+def read_lines(file: list[str]) -> list[list[float]]:
+    """The split/float reader graphical.read replaced, kept as the baseline."""
+    ls = []
+    lt = []
+    rs = []
+    rt = []
+    for line in file[1:]:  # skipping first line as first line is header
+        if line == "":
+            continue
+        temp = line.split(",")
+        ls.append([float(temp[0]), float(temp[1]), float(temp[2])])
+        lt.append([float(temp[3]), float(temp[4]), float(temp[5])])
+        rs.append([float(temp[6]), float(temp[7]), float(temp[8])])
+        rt.append([float(temp[9]), float(temp[10]), float(temp[11])])
+
+    return ls, lt, rs, rt
+
+
+def bench_read(rows: int = 200_000) -> None:
+    """Print the rows/sec of the line-by-line reader and of parse_run."""
+    text = synthetic_run(rows)
+
+    start = time.perf_counter()
+    read_lines(text.split("\n"))
+    lines_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parse_run(io.StringIO(text))
+    bulk_time = time.perf_counter() - start
+
+    print(f"split/float loop: {rows / lines_time:>12,.0f} rows/sec")
+    print(f"parse_run:        {rows / bulk_time:>12,.0f} rows/sec")
+    print(f"speedup:          {lines_time / bulk_time:>12.1f}x")
+
+
+def synthetic_legs(frames: int) -> list[np.ndarray]:
+    """Left shank, left thigh, right shank and right thigh of a steady gait."""
+    t = np.arange(frames + 1) / SAMPLING
+    phase = 2 * np.pi * 1.4 * t  # 84 strides per minute
+    legs = []
+    for shift in (0, 0, np.pi, np.pi):
+        leg = np.zeros((len(t), 3))
+        leg[:, 0] = 0.3 * np.sin(phase + shift)
+        leg[:, 1] = 0.6 * np.sin(phase + shift) + np.pi / 2
+        leg[:, 2] = 0.6 * np.cos(phase + shift)
+        legs.append(leg)
+    legs[0][:, 1] -= 0.4 * (1 + np.sin(phase))
+    legs[2][:, 1] -= 0.4 * (1 + np.sin(phase + np.pi))
+    return legs
+
+
+def bench_render(frames: int = 300) -> None:
+    """
+    Print the frames/sec (rendering and encoding) of both renderer backends and how
+    far apart their frames are.
+    """
+    import pygame
+
+    from numpy_renderer import NumpyRenderer
+
+    ls, lt, rs, rt = synthetic_legs(frames)
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("pygame", "numpy"):
+            start = time.perf_counter()
+            create_video_from_file(
+                LS=ls,
+                LT=lt,
+                RS=rs,
+                RT=rt,
+                video_link=f"{tmp}/{backend}/run.mp4",
+                snaps_folder=f"{tmp}/{backend}/snaps",
+                backend=backend,
+            )
+            elapsed = time.perf_counter() - start
+            print(f"{backend + ':':<8} {frames / elapsed:>10,.1f} frames/sec")
+
+        # pixel comparison against the frames the pygame backend saved
+        differences = []
+        renderer = NumpyRenderer()
+        for batch_start, batch in zip(
+            range(0, frames, 64), renderer.render(ls, lt, rs, rt, batch_frames=64)
+        ):
+            for offset, frame in enumerate(batch):
+                snap = pygame.image.load(
+                    f"{tmp}/pygame/snaps/%06d.png" % (batch_start + offset + 1)
+                )
+                expected = pygame.surfarray.array3d(snap).swapaxes(0, 1)
+                differences.append(
+                    np.abs(frame.astype(int) - expected.astype(int)).max(axis=2)
+                )
+    differences = np.stack(differences)
+    print(f"mean abs difference:      {differences.mean():.2f} / 255")
+    print(f"pixels off by more than 64: {np.mean(differences > 64):.3%}")
+
+
+if __name__ == "__main__":
+    benchmarks = {"read": bench_read, "render": bench_render}
+    name = sys.argv[1] if len(sys.argv) > 1 else "read"
+    args = [int(arg) for arg in sys.argv[2:]]
+    benchmarks[name](*args)
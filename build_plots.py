@@ -1,15 +1,103 @@
-"""Program to build cadence, gait plots and save them as .png files."""
+"""
+Program to build cadence, gait plots and save them as .png files, or as interactive
+.html files downsampled to MAX_PLOT_POINTS points per series.
+"""
 
 import sys
-from typing import Final
 
 import numpy as np
 
-from graphical import LEG_LENGTH, ROTATE, SAMPLING, X_CENTER, read
-from scipy.interpolate import make_interp_spline
+from graphical import LEG_LENGTH, ROTATE, SAMPLING, X_CENTER, read_file
+from stride_analysis import BAND_PERCENTILES, stride_ensemble
 
+MAX_PLOT_POINTS = 1000
 
-def generate_cadence_plot(in_filename: str, out_filename: str) -> None:
+
+def warm_plot_exporter() -> None:
+    """
+    Start the kaleido process behind write_image ahead of time, so that the first
+    plot of a run doesn't pay for it. Only useful in a long-lived process.
+    """
+    import plotly.graph_objects as go
+
+    go.Figure().to_image(format="png")
+
+
+def lttb(
+    x: np.ndarray, y: np.ndarray, n_out: int = MAX_PLOT_POINTS
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Downsample a series with Largest-Triangle-Three-Buckets, which keeps the peaks
+    and troughs that give the series its shape
+    Parameters
+    ----------
+    x : np.ndarray
+        X values, increasing
+    y : np.ndarray
+        Y values
+    n_out : int
+        Number of points to keep, the first and last point are always kept
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Downsampled x and y values
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if n_out >= len(x) or n_out < 3:
+        return x, y
+
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, len(x) - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = len(x) - 1
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # the point picked in the next bucket isn't known yet, use its average
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else len(x)
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        previous = selected[bucket]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        selected[bucket + 1] = start + np.argmax(areas)
+    return x[selected], y[selected]
+
+
+def _ordinal(number: float) -> str:
+    """Ordinal of a percentile for labels, e.g. 25 -> "25th", 2.5 -> "2.5th"."""
+    text: str = f"{number:g}"
+    suffix: str = "th"
+    if text.isdigit() and int(text) % 100 not in (11, 12, 13):
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(int(text) % 10, "th")
+    return text + suffix
+
+
+def write_figure(figure, out_filename: str) -> None:
+    """
+    Write a figure as an interactive .html file if `out_filename` ends in .html,
+    otherwise as an image
+    Parameters
+    ----------
+    figure : plotly.graph_objects.Figure
+        Figure to write
+    out_filename : str
+        File name
+    """
+    if out_filename.endswith(".html"):
+        # plotly.js is loaded from its CDN instead of being inlined in every plot
+        figure.write_html(out_filename, include_plotlyjs="cdn")
+    else:
+        figure.write_image(out_filename)
+
+
+def generate_cadence_plot(
+    in_filename: str, out_filename: str, fps: float = SAMPLING
+) -> None:
     """
     Generate cadence plot
     Parameters
@@ -22,6 +110,8 @@ def generate_cadence_plot(in_filename: str, out_filename: str) -> None:
         Cadence
     time : list[str]
         Time
+    fps : float
+        Frame rate of the run data
 
     Returns
     -------
@@ -32,40 +122,43 @@ def generate_cadence_plot(in_filename: str, out_filename: str) -> None:
     import plotly.graph_objects as go
 
     # first create the figure
-    with open(in_filename, "r") as f:
-        data: Final[list[str]] = f.read().split("\n")
-        ls, lt, rs, rt = read(data)
-
-        cadence = []
-        spm = []
-        for it in range(len(lt) - 2):
-            transfer_x = LEG_LENGTH * np.cos(lt[it][2] + ROTATE)
-            transfer_x2 = LEG_LENGTH * np.cos(lt[it + 1][2] + ROTATE)
-            if (X_CENTER + transfer_x) > X_CENTER and (
-                X_CENTER + transfer_x2
-            ) < X_CENTER:
-                cadence.append(it / SAMPLING)
-                if len(cadence) > 1:
-                    multiplier = 1 / ((cadence[-1] - cadence[0]) / 60)
-                    spm.append(round(len(cadence) * multiplier, 2))
-        # plot spm using plotly
-        figure = go.Figure(
-            layout_title_text="Cadence Over Your Run",
-            data=[
-                go.Scatter(
-                    x=cadence,
-                    y=spm[5:], # cutting off first 5 as they're bad data
-                    mode="lines+markers",
-                    line_shape="spline",
-                )
-            ],
-        )
-        figure.update_xaxes(title_text="Time (s)")
-        figure.update_yaxes(title_text="Strides per minute")
-        figure.write_image(out_filename)
+    ls, lt, rs, rt = read_file(in_filename)
+
+    cadence = []
+    spm = []
+    for it in range(len(lt) - 2):
+        transfer_x = LEG_LENGTH * np.cos(lt[it][2] + ROTATE)
+        transfer_x2 = LEG_LENGTH * np.cos(lt[it + 1][2] + ROTATE)
+        if (X_CENTER + transfer_x) > X_CENTER and (
+            X_CENTER + transfer_x2
+        ) < X_CENTER:
+            cadence.append(it / fps)
+            if len(cadence) > 1:
+                multiplier = 1 / ((cadence[-1] - cadence[0]) / 60)
+                spm.append(round(len(cadence) * multiplier, 2))
+    # spm[i] is measured at cadence[i + 1]
+    # cutting off first 5 as they're bad data
+    x, y = lttb(cadence[6:], spm[5:])
+    # plot spm using plotly
+    figure = go.Figure(
+        layout_title_text="Cadence Over Your Run",
+        data=[
+            go.Scatter(
+                x=x,
+                y=y,
+                mode="lines+markers",
+                line_shape="spline",
+            )
+        ],
+    )
+    figure.update_xaxes(title_text="Time (s)")
+    figure.update_yaxes(title_text="Strides per minute")
+    write_figure(figure, out_filename)
 
 
-def generate_average_stride_plots(in_filename: str, out_filename: str) -> None:
+def generate_average_stride_plots(
+    in_filename: str, out_filename: str, fps: float = SAMPLING
+) -> None:
     """
     Generate average stride plots
     Parameters
@@ -76,6 +169,8 @@ def generate_average_stride_plots(in_filename: str, out_filename: str) -> None:
         Run ID
     filename : str
         File name
+    fps : float
+        Frame rate of the run data
 
     Returns
     -------
@@ -87,118 +182,55 @@ def generate_average_stride_plots(in_filename: str, out_filename: str) -> None:
 
     # first create the figure
     print(in_filename, out_filename)
-    with open(in_filename, "r") as f:
-        data: Final[list[str]] = f.read().split("\n")
-        ls, lt, rs, rt = read(data)
-
-        stride_length_lists = []
-        cadence = []
-
-        previous_spm_index = 0
-        spm = []
-        spm_index = []
-        spm_length = []
-        for it in range(len(lt) - 2):
-            transfer_x = LEG_LENGTH * np.cos(lt[it][2] + ROTATE)
-            transfer_x2 = LEG_LENGTH * np.cos(lt[it + 1][2] + ROTATE)
-            if (X_CENTER + transfer_x) > X_CENTER and (
-                X_CENTER + transfer_x2
-            ) < X_CENTER:
-                cadence.append(it / SAMPLING)
-                if len(cadence) > 1:
-                    multiplier = 1 / ((cadence[-1] - cadence[0]) / 60)
-                    spm_value = round(len(cadence) * multiplier, 2)
-                    if spm_value > 30:  # if cadence is greater than 30 strides a minute
-                        # add all the strides from previous_spm_index to now to list
-                        spm.append(spm_value)
-                        spm_index.append(it)
-                        spm_length.append(it - previous_spm_index)
-
-                    previous_spm_index = it
-                    if len(cadence) > 60:
-                        cadence = []
-
-        # get median spm
-        print(spm)
-        if len(spm) == 0:
-            # didn't get any strides
-            return
-        else:
-            median_spm = np.percentile(spm, 0.5, interpolation="nearest")
-        # get index for median_spm
-        median_spm_index = spm.index(median_spm)
-        print(
-            f"Median spm: {median_spm}, index: {spm_index[median_spm_index]}, length: {spm_length[median_spm_index]}"
+    ls, lt, rs, rt = read_file(in_filename)
+
+    ensemble = stride_ensemble(
+        ls, lt, rs, rt, percentiles=BAND_PERCENTILES, sampling=fps
+    )
+    if not ensemble:
+        # didn't get any strides
+        return
+    print(
+        f"Median spm: {np.median(ensemble['cadence'])}, strides: {ensemble['n_strides']}"
+    )
+
+    leg_names = ["Left", "Right"]
+    band: str = f"{_ordinal(BAND_PERCENTILES[0])}-{_ordinal(BAND_PERCENTILES[1])}"
+    traces = []
+    for leg_name in leg_names:
+        # percentile band drawn as a closed shape around the median
+        traces.append(
+            go.Scatter(
+                x=np.concatenate([ensemble["time"], ensemble["time"][::-1]]),
+                y=np.rad2deg(
+                    np.concatenate(
+                        [ensemble[leg_name]["upper"], ensemble[leg_name]["lower"][::-1]]
+                    )
+                ),
+                fill="toself",
+                opacity=0.3,
+                line_width=0,
+                name=f"{leg_name} ({band} percentile)",
+                hoverinfo="skip",
+            )
         )
-        # plot spm using plotly
-        x = [i for i in range(spm_length[median_spm_index] + 1)]
-        xnew = np.linspace(0, spm_length[median_spm_index], 100)
-        leg_names = ["Left", "Right"]
-        y_interpolated = {}
-        for i, leg in enumerate(leg_names):
-            if leg == "Left":
-                y_just_second_index = np.subtract(
-                    [
-                        i[1]
-                        for i in lt[
-                            spm_index[median_spm_index]
-                            - spm_length[median_spm_index]
-                            - 1 : spm_index[median_spm_index]
-                        ]
-                    ],
-                    [
-                        i[1]
-                        for i in ls[
-                            spm_index[median_spm_index]
-                            - spm_length[median_spm_index]
-                            - 1 : spm_index[median_spm_index]
-                        ]
-                    ],
-                )
-            else:
-                y_just_second_index = np.subtract(
-                    [
-                        i[1]
-                        for i in rt[
-                            spm_index[median_spm_index]
-                            - spm_length[median_spm_index]
-                            - 1 : spm_index[median_spm_index]
-                        ]
-                    ],
-                    [
-                        i[1]
-                        for i in rs[
-                            spm_index[median_spm_index]
-                            - spm_length[median_spm_index]
-                            - 1 : spm_index[median_spm_index]
-                        ]
-                    ],
-                )
-            gfg = make_interp_spline(
-                x,
-                y_just_second_index,
-                k=3,
+        traces.append(
+            go.Scatter(
+                x=ensemble["time"],
+                y=np.rad2deg(ensemble[leg_name]["median"]),
+                # name of the leg
+                name=leg_name,
+                mode="lines+markers",
             )
-
-            y_interpolated[leg_names[i]] = gfg(xnew)
-
-        figure = go.Figure(
-            # make title
-            layout_title_text="Median Stride",
-            data=[
-                go.Scatter(
-                    x=[i / SAMPLING for i in xnew],
-                    y=np.rad2deg(y_interpolated[leg_name]),
-                    # name of the leg
-                    name=leg_name,
-                    mode="lines+markers",
-                )
-                for leg_name in leg_names
-            ],
         )
-        figure.update_xaxes(title_text="Time (s)")
-        figure.update_yaxes(title_text="Degrees")
-        figure.write_image(out_filename)
+    figure = go.Figure(
+        # make title
+        layout_title_text="Median Stride",
+        data=traces,
+    )
+    figure.update_xaxes(title_text="Time (s)")
+    figure.update_yaxes(title_text="Degrees")
+    write_figure(figure, out_filename)
 
 
 if __name__ == "__main__":
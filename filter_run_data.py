@@ -2,9 +2,16 @@
 Description
 -----------
 This script filters the raw data from the run data file and saves the filtered data to a new file.
-It uses previous run data to create a new run with interpolated data points to increase the frame rate
-to 30 frames per second, and then filters the data using a Kallman filter to n=10 in order to
-smooth the data and help against possible noise or acceleration issues in the IMU.
+The angles are unwrapped first so that no later step runs through a jump from pi to -pi.
+Samples dropped by the IMU (empty fields) are then filled in over the whole array: gaps of at
+most MAX_GAP rows are linearly interpolated (or forward-filled), and rows still missing values
+afterwards are dropped so that the columns stay aligned. Every row keeps its timestamp (one every
+1 / SENSOR_RATE seconds if the file has no timestamp column), so longer gaps are bridged in time
+instead of pulling the rest of the run earlier. It then resamples every channel from the sensor
+rate (measured from the timestamps) to the frame rate the run is rendered at, TARGET_FPS by
+default, with a polyphase filter, and then filters the data using a Kallman filter to
+n=KALLMAN_FILTER_N in order to smooth the data and help against possible noise or acceleration
+issues in the IMU.
 
 
 Author
@@ -15,17 +22,50 @@ Notes
 -----
 *.run files are in the form of csv's with the following columns:
 l_shank_x,l_shank_y,l_shank_z,l_thigh_x,l_thigh_y,l_thigh_z,r_shank_x,r_shank_y,r_shank_z,r_thigh_x,r_thigh_y,r_thigh_z
+and optionally a timestamp column in seconds. Filtered files only have the 12 angle columns, one
+row per frame at the target frame rate.
 """
 
 import sys
-import csv
-from typing import Final
-from typing import Optional
+from fractions import Fraction
+from typing import Final, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import make_interp_spline
+from scipy.signal import resample_poly
 
 KALLMAN_FILTER_N: Final[int] = 4
+MAX_GAP: Final[int] = 5
+# rate of files without timestamps, they used to be doubled to reach 30 fps
+SENSOR_RATE: Final[float] = 15
+# same as graphical.SAMPLING
+TARGET_FPS: Final[float] = 30
+TIMESTAMP_COLUMN: Final[str] = "timestamp"
+COLUMN_NAMES: Final[list[str]] = [
+    "l_shank_x",
+    "l_shank_y",
+    "l_shank_z",
+    "l_thigh_x",
+    "l_thigh_y",
+    "l_thigh_z",
+    "r_shank_x",
+    "r_shank_y",
+    "r_shank_z",
+    "r_thigh_x",
+    "r_thigh_y",
+    "r_thigh_z",
+]
 
 
-def filter_run_data(run_file: str, output_file: str) -> None:
+def filter_run_data(
+    run_file: str,
+    output_file: str,
+    max_gap: int = MAX_GAP,
+    method: str = "linear",
+    target_fps: float = TARGET_FPS,
+    sensor_rate: float = SENSOR_RATE,
+) -> dict[str, int]:
     """
     Filters the raw data from the run data file and saves the filtered data to a new file.
 
@@ -35,119 +75,256 @@ def filter_run_data(run_file: str, output_file: str) -> None:
         The file path of the raw run data file.
     output_file : str
         The file path of the output file to save the filtered data to.
+    max_gap : int
+        Longest run of missing samples in a column that is filled in.
+    method : str
+        How gaps are filled, "linear" or "ffill".
+    target_fps : float
+        Frame rate of the filtered data, the run has to be rendered at the same rate.
+    sensor_rate : float
+        Sample rate of the raw data, only used if it has no timestamp column.
+
+    Returns
+    -------
+    dict[str, int]
+        Gap statistics of the raw data, see fill_gaps.
+    """
+    print("Reading run data...")
+    values, timestamps = read_raw_run(run_file)
+    if timestamps is None:
+        # rows dropped for gaps longer than max_gap would otherwise pull every later
+        # sample earlier in the video and the plots
+        timestamps = np.arange(len(values)) / sensor_rate
+    # angles are unwrapped so that a jump from pi to -pi is neither filled in,
+    # resampled nor smoothed; missing timestamps are filled in like any other value
+    values = np.column_stack([unwrap_angles(values), timestamps])
+    values, gap_stats = fill_gaps(values, max_gap=max_gap, method=method)
+    print(f"Gap statistics: {gap_stats}")
+    values, timestamps = values[:, :-1], values[:, -1]
+
+    values = resample(
+        values, target_fps=target_fps, sensor_rate=sensor_rate, timestamps=timestamps
+    )
+    # the smoothing window covers the same time at every frame rate
+    n: int = max(round(KALLMAN_FILTER_N * target_fps / TARGET_FPS), 0)
+    values = get_kallman_values(values, n=n)
+    values = (values + np.pi) % (2 * np.pi) - np.pi
+    print("Writing filtered run data...")
+    np.savetxt(
+        output_file,
+        values,
+        delimiter=",",
+        header=",".join(COLUMN_NAMES),
+        comments="",
+        fmt="%.9g",
+    )
+    return gap_stats
+
+
+def read_raw_run(run_file: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Reads a raw run data file, keeping missing and malformed values as NaN.
+
+    Parameters
+    ----------
+    run_file : str
+        The file path of the raw run data file.
 
     Returns
     -------
-    None
+    tuple[np.ndarray, Optional[np.ndarray]]
+        The raw run data, shape (n, 12) in the order of COLUMN_NAMES, and the
+        timestamp of every row in seconds if the file has a timestamp column.
     """
-    previous_lines: list[dict[str, str]] = []
-    with open(run_file, "r") as file:
-        print("Reading run data...")
-        # n_lines = len(file.readlines())
-        RUN_DATA: Final[csv.DictReader] = csv.DictReader(file, delimiter=",")
-        # n_lines: int = sum(1 for row in RUN_DATA)
-        # print(n_lines)
-        # for row in RUN_DATA:
-        #     print(row['l_shank_x'])
-        # RUN_DATA_LIST = list(RUN_DATA)
-        new_values: dict[str, str] = {}
-        with open(output_file, "w") as output:
-            print("Writing filtered run data...")
-            output.write(
-                "l_shank_x,l_shank_y,l_shank_z,l_thigh_x,l_thigh_y,l_thigh_z,r_shank_x,r_shank_y,r_shank_z,r_thigh_x,r_thigh_y,r_thigh_z\n"
-            )
-            for i, row in enumerate(RUN_DATA):
-                print(row["l_shank_x"])
-                # interpolate the values to 30 fps and filter on the newly interpolated values
-                if len(previous_lines) != 0:
-                    interpolated_values: dict[str, str] = interpolate_to_30_fps(
-                        previous_line=previous_lines, current_line=row, it=i
-                    )
-                else:
-                    interpolated_values = row
-                new_values: dict[str, str] = get_kallman_values(
-                    previous_lines=previous_lines, current_line=interpolated_values
-                )
-                output.write(",".join(new_values.values()) + "\n")
-                if len(previous_lines) >= KALLMAN_FILTER_N:
-                    previous_lines.append(interpolated_values)
-                    previous_lines.pop(0)
-
-                # get new kallman filter values for previous line
-                new_values: dict[str, str] = {}
-                if len(previous_lines) != 0:
-                    new_values: dict[str, str] = get_kallman_values(
-                        previous_lines=previous_lines, current_line=row
-                    )
-                    new_values = row
-                else:
-                    new_values = row
-                if len(previous_lines) >= KALLMAN_FILTER_N:
-                    previous_lines.append(new_values)
-                    previous_lines.pop(0)
-                output.write(",".join(new_values.values()) + "\n")
-
-
-def interpolate_to_30_fps(
-    *, previous_line: dict[str, str], current_line: dict[str, str], it: int
-) -> dict:
+    try:
+        # without index_col=False an over-long first row makes l_shank_x the index
+        # and shifts every channel
+        data = pd.read_csv(run_file, engine="c", on_bad_lines="skip", index_col=False)
+    except pd.errors.EmptyDataError:
+        return np.empty((0, len(COLUMN_NAMES))), None
+    timestamps: Optional[np.ndarray] = None
+    if TIMESTAMP_COLUMN in data.columns:
+        timestamps = pd.to_numeric(data[TIMESTAMP_COLUMN], errors="coerce").to_numpy(
+            float
+        )
+    data = data.reindex(columns=COLUMN_NAMES)
+    return data.apply(pd.to_numeric, errors="coerce").to_numpy(float), timestamps
+
+
+def unwrap_angles(values: np.ndarray) -> np.ndarray:
     """
-    Interpolates the run data to 30 frames per second.
+    Unwraps every column of angles over its valid samples.
 
     Parameters
     ----------
-    run_data : dict
-        The raw run data.
+    values : np.ndarray
+        Angles in radians with missing samples as NaN, shape (n, columns).
 
     Returns
     -------
-    dict
-        The interpolated run data.
+    np.ndarray
+        The angles without jumps of more than pi between valid samples, missing
+        samples stay NaN.
     """
-    keys: list[str] = list(current_line.keys())
-    new_values: dict[str, str] = {}
-    for key in keys:
-        # average the values of the current frame and the next frame
-        if previous_line[key] != "" and current_line[key] != "":
-            new_values[key] = str(
-                (float(previous_line[key]) + float(current_line[key])) / 2
-            )
-        else:
-            print(f"Error: Missing value in frame {it} or {it + 1}")
-    return new_values
-
-
-def get_kallman_values(
-    *, previous_lines: list[dict[str, str]], current_line: dict[str, str]
-) -> dict:
+    values = np.array(values, dtype=float)
+    for column in values.T:
+        valid = ~np.isnan(column)
+        column[valid] = np.unwrap(column[valid])
+    return values
+
+
+def fill_gaps(
+    values: np.ndarray, *, max_gap: int = MAX_GAP, method: str = "linear"
+) -> tuple[np.ndarray, dict[str, int]]:
+    """
+    Fills the gaps left by dropped samples in every column at once.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The run data with missing samples as NaN, shape (n, columns).
+    max_gap : int
+        Longest run of missing samples in a column that is filled in.
+    method : str
+        "linear" interpolates between the samples around the gap, "ffill" repeats the
+        sample before it. Gaps at the start of the run can't be filled either way, nor
+        can gaps at the end of the run with "linear".
+
+    Returns
+    -------
+    tuple[np.ndarray, dict[str, int]]
+        The run data without rows that still miss a value, and the gap statistics:
+        rows, missing_values, gaps, longest_gap, filled_values and dropped_rows.
+    """
+    if method not in ("linear", "ffill"):
+        raise ValueError(f"Unknown gap filling method {method}")
+    values = np.asarray(values, dtype=float)
+    n_rows: int = len(values)
+    missing: np.ndarray = np.isnan(values)
+
+    # gaps are found as the runs of True in every column of the mask
+    edges = np.diff(np.pad(missing.T, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    gap_columns, gap_starts = np.nonzero(edges == 1)
+    gap_ends: np.ndarray = np.nonzero(edges == -1)[1]
+    gap_lengths: np.ndarray = gap_ends - gap_starts
+
+    # length of the gap every missing value belongs to
+    gap_length = np.zeros(values.shape, dtype=int)
+    offsets = np.arange(gap_lengths.sum()) - np.repeat(
+        np.cumsum(gap_lengths) - gap_lengths, gap_lengths
+    )
+    gap_length[
+        np.repeat(gap_starts, gap_lengths) + offsets,
+        np.repeat(gap_columns, gap_lengths),
+    ] = np.repeat(gap_lengths, gap_lengths)
+
+    # index of the last valid sample at or before, and first at or after, every row
+    rows = np.arange(n_rows)[:, None]
+    previous = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    following = np.minimum.accumulate(
+        np.where(missing, n_rows, rows)[::-1], axis=0
+    )[::-1]
+    column_index = np.arange(values.shape[1])[None, :]
+    previous_values = values[np.clip(previous, 0, None), column_index]
+    following_values = values[np.clip(following, None, n_rows - 1), column_index]
+
+    fillable = missing & (gap_length <= max_gap) & (previous >= 0)
+    if method == "linear":
+        fillable &= following < n_rows
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = (rows - previous) / (following - previous)
+        filled_values = previous_values + weight * (following_values - previous_values)
+    else:
+        filled_values = previous_values
+    filled: np.ndarray = np.where(fillable, filled_values, values)
+
+    complete = ~np.isnan(filled).any(axis=1)
+    gap_stats: dict[str, int] = {
+        "rows": n_rows,
+        "missing_values": int(missing.sum()),
+        "gaps": len(gap_lengths),
+        "longest_gap": int(gap_lengths.max(initial=0)),
+        "filled_values": int(fillable.sum()),
+        "dropped_rows": int(n_rows - complete.sum()),
+    }
+    return filled[complete], gap_stats
+
+
+def resample(
+    values: np.ndarray,
+    *,
+    target_fps: float = TARGET_FPS,
+    sensor_rate: float = SENSOR_RATE,
+    timestamps: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Resamples every channel of the run data to the target frame rate.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The run data without missing values, shape (n, columns).
+    target_fps : float
+        Frame rate to resample to.
+    sensor_rate : float
+        Sample rate of `values`, ignored if `timestamps` are given.
+    timestamps : Optional[np.ndarray]
+        Time of every row in seconds. The rows are first interpolated onto a uniform
+        grid at the median rate of the timestamps, which then is the sensor rate.
+
+    Returns
+    -------
+    np.ndarray
+        The resampled run data, one row every 1 / target_fps seconds.
+    """
+    if len(values) < 2:
+        return values
+    if timestamps is not None:
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+        unique = np.concatenate([[True], np.diff(timestamps) > 0])
+        timestamps, values = timestamps[unique], values[unique]
+        if len(values) < 2:
+            return values
+        sensor_rate = 1 / np.median(np.diff(timestamps))
+        # the tolerance keeps rounding errors from dropping the last sample
+        n_samples = int((timestamps[-1] - timestamps[0]) * sensor_rate + 1e-6) + 1
+        grid = timestamps[0] + np.arange(n_samples) / sensor_rate
+        values = make_interp_spline(timestamps, values, k=1, axis=0)(grid)
+
+    ratio = Fraction(target_fps / sensor_rate).limit_denominator(100)
+    return resample_poly(
+        values, ratio.numerator, ratio.denominator, axis=0, padtype="line"
+    )
+
+
+def get_kallman_values(values: np.ndarray, n: int = KALLMAN_FILTER_N) -> np.ndarray:
     """
     Returns the Kallman filter values for the run data.
 
+    Parameters
+    ----------
+    values : np.ndarray
+        The run data without missing values, shape (n, columns).
+    n : int
+        Number of previous rows averaged with every row.
+
     Returns
     -------
-    dict
-        The Kallman filter values.
+    np.ndarray
+        The mean of every row and the up to n rows before it.
     """
-    keys: list[str] = list(current_line.keys())
-    new_values: dict[str, str] = {}
-
-    for key in keys:
-        new_values[key] = current_line[key]
-        # if the value is not empty, add it to the sum
-        for it, line in enumerate(previous_lines[::-1]):
-            alpha: float = 1 / (it + 1)
-            if line[key] != "":
-                # loop through the number of frames to go back
-                new_values[key] += str(
-                    (alpha) * (float(new_values[key]) - float(line[key]))
-                )
-            else:
-                print(f"Error: Missing value in frame {it}")
-        # if there are values to interpolate, interpolate the value
-    return new_values
+    if len(values) == 0:
+        return values
+    sums = np.cumsum(values, axis=0)
+    window = n + 1
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)[:, None]
+    return sums / counts
 
 
 if __name__ == "__main__":
     run_file: str = sys.argv[1]
     output_file: str = sys.argv[2]
-    filter_run_data(run_file, output_file)
+    target_fps: float = float(sys.argv[3]) if len(sys.argv) > 3 else TARGET_FPS
+    filter_run_data(run_file, output_file, target_fps=target_fps)
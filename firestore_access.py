@@ -0,0 +1,143 @@
+"""
+Description
+-----------
+Firestore access layer for the StrideSync functions. Every read and write the
+functions make against Firestore goes through here, taking the client as an
+argument so the same code runs against production, the Firestore emulator
+(set FIRESTORE_EMULATOR_HOST) or any object with the same interface.
+"""
+
+from datetime import datetime
+from typing import Final, Optional
+
+from google.cloud import firestore
+
+# per-user totals of every processed run, updated incrementally
+AGGREGATE_DOCUMENT: Final[str] = "aggregates/runs"
+
+
+def get_latest_post(
+    client: firestore.Client, userId: str
+) -> Optional[firestore.DocumentReference]:
+    """
+    Get the most recent post of a user
+    Parameters
+    ----------
+    client : firestore.Client
+        Firestore client
+    userId : str
+        User ID
+
+    Returns
+    -------
+    Optional[firestore.DocumentReference]
+        Reference to the most recent post, None if the user has no posts
+    """
+    query_ans = list(
+        client.collection(f"users/{userId}/posts")
+        .order_by("datePosted", direction=firestore.Query.DESCENDING)
+        .limit(1)
+        .select([])
+        .stream()
+    )
+    if len(query_ans) == 0:
+        return None
+    return query_ans[0].reference
+
+
+def update_post_links(
+    client: firestore.Client,
+    userId: str,
+    post_ref: firestore.DocumentReference,
+    links: dict[str, str],
+    summary: Optional[dict] = None,
+    run_date: Optional[datetime] = None,
+) -> None:
+    """
+    Write the media links of a post and increment the user's numPosts in one batch.
+    If a run summary is given it is stored with the post and added to the user's
+    aggregate in the same batch.
+    Parameters
+    ----------
+    client : firestore.Client
+        Firestore client
+    userId : str
+        User ID
+    post_ref : firestore.DocumentReference
+        Reference to the post to update
+    links : dict[str, str]
+        Post fields to set, e.g. {"videoLink": ...}
+    summary : Optional[dict]
+        Run summary from stride_analysis.run_summary
+    run_date : Optional[datetime]
+        When the run was processed, now if not given
+    """
+    batch = client.batch()
+    # only the changed fields are sent, the rest of the post is left untouched
+    fields: dict = dict(links)
+    if summary is not None:
+        fields["summary"] = summary
+    batch.update(post_ref, fields)
+    # merge creates the user document with numPosts = 1 if it doesn't exist yet
+    batch.set(
+        client.document(f"users/{userId}"),
+        {"numPosts": firestore.Increment(1)},
+        merge=True,
+    )
+    if summary is not None:
+        batch.set(
+            client.document(f"users/{userId}/{AGGREGATE_DOCUMENT}"),
+            aggregate_update(summary, run_date or datetime.now()),
+            merge=True,
+        )
+    batch.commit()
+
+
+def aggregate_update(summary: dict, run_date: datetime) -> dict:
+    """
+    Build the update that adds one run to a user's aggregate document. Every field is
+    a server-side transform, so the aggregate is never read back and concurrent runs
+    of the same user don't overwrite each other.
+    Parameters
+    ----------
+    summary : dict
+        Run summary from stride_analysis.run_summary
+    run_date : datetime
+        When the run was processed, selects its weekly bucket
+
+    Returns
+    -------
+    dict
+        Totals over all runs ("runs", "duration", "strides", "pronations",
+        "supinations"), the extreme knee angles and the same totals plus the sum of
+        the median cadences ("cadenceSum", divide by "cadenceRuns" for the average)
+        per ISO week under "weeks"
+    """
+    totals: dict = {
+        "runs": firestore.Increment(1),
+        "duration": firestore.Increment(summary["duration"]),
+        "strides": firestore.Increment(summary["strides"]),
+        "pronations": firestore.Increment(summary["pronations"]),
+        "supinations": firestore.Increment(summary["supinations"]),
+    }
+    median_cadence: Optional[float] = summary["cadence"]["p50"]
+    week: dict = dict(totals)
+    if median_cadence is not None:
+        week["cadenceSum"] = firestore.Increment(median_cadence)
+        week["cadenceRuns"] = firestore.Increment(1)
+
+    knee_angle: dict = {}
+    for leg, extremes in summary["kneeAngle"].items():
+        if extremes["min"] is None:
+            continue
+        knee_angle[leg] = {
+            "min": firestore.Minimum(extremes["min"]),
+            "max": firestore.Maximum(extremes["max"]),
+        }
+
+    year, week_number, _ = run_date.isocalendar()
+    return {
+        **totals,
+        "kneeAngle": knee_angle,
+        "weeks": {f"{year}-W{week_number:02d}": week},
+    }
@@ -1,12 +1,16 @@
+import io
 import os
 import sys
-from typing import Final
+from typing import Final, Optional
 from datetime import datetime
 
 import numpy as np
+import pandas as pd
 import pygame
 from firebase_admin import storage
 
+import profiling
+
 os.environ["IMAGEIO_FFMPEG_EXE"] = "/opt/homebrew/bin/ffmpeg"
 shoes = "shoe.png"
 
@@ -19,29 +23,64 @@ X_CENTER = SCREEN_W * 0.5
 Y_CENTER = SCREEN_H * 0.5
 LEG_LENGTH = 100
 SAMPLING = 30
+COLUMNS = 12
 
 ROTATE = 1.5708
+# degrees the right shank may roll away from its starting angle before the
+# pronation/supination indicator turns red
+PRONATION_THRESHOLD = 25
 
 SNAPS = "/tmp/snaps"
 
 data_file = "/tmp/data.run"
 
 
-def read(file: list[str]) -> list[list[float]]:
-    ls = []
-    lt = []
-    rs = []
-    rt = []
-    for line in file[1:]:  # skipping first line as first line is header
-        if line == "":
-            continue
-        temp = line.split(",")
-        ls.append([float(temp[0]), float(temp[1]), float(temp[2])])
-        lt.append([float(temp[3]), float(temp[4]), float(temp[5])])
-        rs.append([float(temp[6]), float(temp[7]), float(temp[8])])
-        rt.append([float(temp[9]), float(temp[10]), float(temp[11])])
+def parse_run(source) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parse run data in bulk with the pandas C parser
+    Parameters
+    ----------
+    source : str | file-like
+        Path of a .run file or an open text file, the first line is the header
 
-    return ls, lt, rs, rt
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        Left shank, left thigh, right shank and right thigh, float arrays of shape (n, 3).
+        Values past the twelfth of a row (e.g. a trailing comma) are ignored, empty
+        lines and rows with missing or non-numeric values are dropped.
+    """
+    try:
+        data = pd.read_csv(
+            source,
+            header=None,
+            skiprows=1,
+            names=range(COLUMNS),
+            # without these an over-long first row makes column 0 the index and
+            # shifts every column
+            index_col=False,
+            usecols=range(COLUMNS),
+            engine="c",
+            on_bad_lines="skip",
+        )
+    except pd.errors.EmptyDataError:
+        data = pd.DataFrame(columns=range(COLUMNS), dtype=float)
+    values = data.apply(pd.to_numeric, errors="coerce").dropna().to_numpy(float)
+    return values[:, 0:3], values[:, 3:6], values[:, 6:9], values[:, 9:12]
+
+
+def read_file(
+    filename: str,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Read a .run file, see parse_run."""
+    return parse_run(filename)
+
+
+def read(
+    file: list[str],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Parse the lines of a .run file, see parse_run."""
+    return parse_run(io.StringIO("\n".join(file)))
 
 
 def get_knee_pos(LT, RT, iteration: float, leg: str, point: str):
@@ -87,7 +126,7 @@ def get_shank_pos(LS, RS, it: float, knee_pos: list[float], leg: str):
         ]
 
 
-def create_video(image_folder: str, video_name: str) -> None:
+def create_video(image_folder: str, video_name: str, fps: float = SAMPLING) -> None:
     """
     Create video from images in folder
     Parameters
@@ -96,6 +135,8 @@ def create_video(image_folder: str, video_name: str) -> None:
         Folder
     video_name : str
         Video name
+    fps : float
+        Frame rate of the images
     """
     images = [
         f"{image_folder}/{img}"
@@ -104,14 +145,14 @@ def create_video(image_folder: str, video_name: str) -> None:
     ]
     # sort by integer value
     images.sort(key=lambda x: int(x.split(".")[0].split("/")[-1]))
-    clip = moviepy.video.io.ImageSequenceClip.ImageSequenceClip(images, fps=SAMPLING)
-    clip.write_videofile(video_name, fps=SAMPLING, threads=1, codec="libx264")
+    clip = moviepy.video.io.ImageSequenceClip.ImageSequenceClip(images, fps=fps)
+    clip.write_videofile(video_name, fps=fps, threads=1, codec="libx264")
     print("video released!")
 
 def check_pronate(rs: float, marker: float):
     vert_s = np.rad2deg(rs)
     diff = abs(abs(marker) - abs(vert_s))
-    if diff >= 25:
+    if diff >= PRONATION_THRESHOLD:
         print(f"PRON: diff: {diff}")
         return (255, 0, 0)
     else: # green is fine
@@ -120,7 +161,7 @@ def check_pronate(rs: float, marker: float):
 def check_supinate(rs: float, marker: float):
     vert_s = np.rad2deg(rs)
     diff = abs(abs(marker) - abs(vert_s))
-    if diff >= 25:
+    if diff >= PRONATION_THRESHOLD:
         print(f"SUP: diff: {diff}")
         return (255, 0, 0)
     else: # green is fine
@@ -138,6 +179,25 @@ def calc_angle(LT, LS, RT, RS, iteration):
 
     return l_angle, r_angle
 
+def load_assets() -> dict:
+    """
+    Initialize pygame and load the fonts and sprites used to draw every frame, so
+    they can be reused across frames and, in the worker, across runs
+    Returns
+    -------
+    dict
+        "font_a" and "font_b" fonts and the scaled, flipped "shoe" sprite
+    """
+    pygame.init()
+    pygame.display.set_caption("2D Animation - Lateral Perspective")
+    shoe = pygame.transform.flip(pygame.image.load(shoes), True, False)
+    return {
+        "font_a": pygame.font.SysFont("Arial", 24),
+        "font_b": pygame.font.SysFont("Arial", 24),
+        "shoe": pygame.transform.scale(shoe, (40, 50)),
+    }
+
+
 def create_video_from_file(
     *,
     LS: list[list[float]],
@@ -145,6 +205,10 @@ def create_video_from_file(
     RS: list[list[float]],
     RT: list[list[float]],
     video_link: str,
+    snaps_folder: str = SNAPS,
+    assets: Optional[dict] = None,
+    backend: str = "pygame",
+    fps: float = SAMPLING,
 ) -> str:
     """
     Create video from file
@@ -158,32 +222,65 @@ def create_video_from_file(
         Right shank
     RT : list[list[float]]
         Right thigh
+    video_link : str
+        Path of the video to write
+    snaps_folder : str
+        Folder the frames are saved to
+    assets : Optional[dict]
+        Assets from load_assets, loaded (and released afterwards) if not given
+    backend : str
+        "pygame" draws every frame on a pygame surface and saves it as a .png,
+        "numpy" draws batches of frames into arrays and encodes them directly
+        (see numpy_renderer). Only the first frame is saved as a .png then.
+    fps : float
+        Frame rate of the run data, one frame is drawn per row
 
     Returns
     -------
     str
         Video name
     """
+    if backend == "numpy":
+        from numpy_renderer import NumpyRenderer
+
+        if assets is None:
+            renderer = NumpyRenderer()
+        else:
+            # kept with the assets so that its glyph cache is reused across runs
+            if "numpy_renderer" not in assets:
+                assets["numpy_renderer"] = NumpyRenderer(assets)
+            renderer = assets["numpy_renderer"]
+        return renderer.create_video(
+            LS=LS,
+            LT=LT,
+            RS=RS,
+            RT=RT,
+            video_link=video_link,
+            snaps_folder=snaps_folder,
+            fps=fps,
+        )
+    elif backend != "pygame":
+        raise ValueError(f"Unknown renderer backend {backend}")
 
     try:
-        os.makedirs("/tmp/snaps")
+        os.makedirs(snaps_folder)
     except OSError:
         pass
 
     try:
-        os.makedirs("/tmp/movies")
+        os.makedirs(os.path.dirname(video_link))
     except OSError:
         pass
 
-    pygame.init()
-    # pygame.display.init()
+    owns_assets: bool = assets is None
+    if owns_assets:
+        assets = load_assets()
     window = pygame.Surface((SCREEN_W, SCREEN_W))
-    pygame.display.set_caption("2D Animation - Lateral Perspective")
     window.fill((0, 0, 0))
 
     # displaying text
-    font_a = pygame.font.SysFont("Arial", 24)
-    font_b = pygame.font.SysFont("Arial", 24)
+    font_a = assets["font_a"]
+    font_b = assets["font_b"]
 
     # initialize top of thigh position at center of screen
     l_thigh_pos = [X_CENTER, Y_CENTER]
@@ -207,7 +304,7 @@ def create_video_from_file(
                 break
 
         # displaying length of activity
-        activity = str(round(iteration / SAMPLING, 2))
+        activity = str(round(iteration / fps, 2))
         activity_length = font_b.render(f"Length of activity: {activity}", True, (255, 255, 255), (0, 0, 0))
         window.blit(activity_length, (50, 50)) 
 
@@ -217,7 +314,7 @@ def create_video_from_file(
         # print(f"{marker_ang} | current: {current_x} vs before: {before_x}")
         if (current_x > marker_ang) and (before_x < marker_ang):
             cadence += 1
-            spm = round(cadence / (iteration / SAMPLING / 60), 2)
+            spm = round(cadence / (iteration / fps / 60), 2)
         spm_text = font_b.render(f"Cadence: {spm} spm", True, (255, 255, 255), (0, 0, 0))
         window.blit(spm_text, (50, 80))
 
@@ -288,35 +385,34 @@ def create_video_from_file(
         # pygame.draw.circle(window, check_strike, [550, 130], 12, 0) 
 
         # adding shoes lol
-        shoe_l = pygame.image.load(shoes); shoe_r = pygame.image.load(shoes)
-        flipped_shoe_l = pygame.transform.flip(shoe_l, True, False)
-        flipped_shoe_r = pygame.transform.flip(shoe_r, True, False)
-        shoe_l = pygame.transform.scale(flipped_shoe_l, (40, 50))
-        shoe_r = pygame.transform.scale(flipped_shoe_r, (40, 50))
+        shoe_l = assets["shoe"]; shoe_r = assets["shoe"]
         window.blit(shoe_l, (l_shank_pos[0]-30, l_shank_pos[1]-20)); window.blit(shoe_r, (r_shank_pos[0]-30, r_shank_pos[1]-20))
 
         # time.sleep(1 / SAMPLING)  # / SAMPLING
         # pygame.display.flip()
         window.blit(window, (0, 0))
         # save image
-        filename = "/tmp/snaps/%06d.png" % file_num
+        filename = f"{snaps_folder}/%06d.png" % file_num
         pygame.image.save(window, filename)
         iteration += 1
         window.fill((0, 0, 0))
 
-    pygame.quit()
+    if owns_assets:
+        pygame.quit()
     # once all photos recorded, create video
     # create name using {DATE}T{TIME}Z.mp4
     # now: datetime = datetime.now()
     # date: str = now.strftime("%Y-%m-%dT%H:%M:%S")
     # video_link: str = f"/tmp/movies/{date}.mp4"
-    create_video("/tmp/snaps", video_link)
+    with profiling.stage("encoding"):
+        create_video(snaps_folder, video_link, fps=fps)
 
 
 if __name__ == "__main__":
     data_file_name = sys.argv[1]
+    video_link = sys.argv[2] if len(sys.argv) > 2 else "/tmp/movies/run.mp4"
     print(data_file_name)
-    with open(data_file, "r") as f:
-        data = f.read().split("\n")
-    ls, lt, rs, rt = read(data)
-    create_video_from_file(LS=ls, LT=lt, RS=rs, RT=rt, video_link=data_file_name)
+    ls, lt, rs, rt = read_file(data_file_name)
+    with profiling.session(f"{os.path.dirname(video_link) or '.'}/profiles"):
+        with profiling.stage("rendering"):
+            create_video_from_file(LS=ls, LT=lt, RS=rs, RT=rt, video_link=video_link)
@@ -0,0 +1,363 @@
+"""
+Description
+-----------
+Run-processing job queues. The storage trigger puts a job on a queue and the
+long-lived worker (worker.py) takes jobs off it. All queues share the same
+put/get/ack/fail/release interface:
+
+- InMemoryJobQueue: single process, for tests and local runs
+- FileJobQueue: one JSON file per job in a directory, for running the worker
+  locally next to the emulator
+- FirestoreJobQueue: documents in a Firestore collection, for production where
+  the trigger and the worker don't share a filesystem
+
+A job is a dict with the keys "userId", "bucket" and "name" (the object path).
+A job taken off a queue is claimed and then either acked (done, removed), failed
+(kept with the error, not retried) or released (put back on the queue). A claim
+left unfinished for `lease` seconds, e.g. because its worker died, is released by
+the next `get`. A job released `max_attempts` times is failed instead.
+"""
+
+import os
+import json
+import queue
+import time
+import uuid
+import threading
+from typing import Final, Optional
+
+JOB_QUEUE_ENV: Final[str] = "STRIDESYNC_JOB_QUEUE"
+JOBS_COLLECTION: Final[str] = "jobs"
+JOB_KEYS: Final[tuple[str, ...]] = ("userId", "bucket", "name")
+# longer than the slowest run, a claim this old belongs to a dead worker
+LEASE_SECONDS: Final[float] = 30 * 60
+MAX_ATTEMPTS: Final[int] = 3
+
+
+def _new_job_id() -> str:
+    """Job ID that sorts by creation time, so jobs are taken first in, first out."""
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+class InMemoryJobQueue:
+    """Job queue backed by queue.Queue, jobs are lost when the process exits."""
+
+    def __init__(
+        self, lease: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS
+    ) -> None:
+        self.lease: float = lease
+        self.max_attempts: int = max_attempts
+        self._queue: queue.Queue = queue.Queue()
+        # job ID -> (job, attempts, claim time) of the claimed jobs
+        self._claimed: dict[str, tuple[dict, int, float]] = {}
+        # job ID -> job and error of the failed jobs
+        self.failed: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def put(self, job: dict) -> str:
+        job_id: str = _new_job_id()
+        self._queue.put((job_id, job, 0))
+        return job_id
+
+    def get(self, timeout: Optional[float] = None) -> Optional[tuple[str, dict]]:
+        """
+        Take the next job off the queue
+        Parameters
+        ----------
+        timeout : Optional[float]
+            Seconds to wait for a job, None to wait forever
+
+        Returns
+        -------
+        Optional[tuple[str, dict]]
+            Job ID and job, None if no job arrived before the timeout
+        """
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, (_, _, claimed_at) in self._claimed.items()
+                if claimed_at < time.time() - self.lease
+            ]
+        for job_id in expired:
+            self.release(job_id)
+        try:
+            job_id, job, attempts = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._claimed[job_id] = (job, attempts, time.time())
+        return job_id, job
+
+    def ack(self, job_id: str) -> None:
+        with self._lock:
+            self._claimed.pop(job_id, None)
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            claimed = self._claimed.pop(job_id, None)
+            if claimed is not None:
+                self.failed[job_id] = {**claimed[0], "error": error}
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            claimed = self._claimed.pop(job_id, None)
+        if claimed is None:
+            return
+        job, attempts, _ = claimed
+        if attempts + 1 >= self.max_attempts:
+            with self._lock:
+                self.failed[job_id] = {**job, "error": f"unfinished after {attempts + 1} attempts"}
+            return
+        self._queue.put((job_id, job, attempts + 1))
+
+
+class FileJobQueue:
+    """
+    Job queue backed by a directory. Pending jobs are `<id>.json`, a job is claimed
+    by renaming it to `<id>.json.claimed` (atomic on one filesystem), removed on ack
+    and renamed to `<id>.json.failed`, with the error added, on fail.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        poll_interval: float = 0.5,
+        lease: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> None:
+        self.directory: str = directory
+        self.poll_interval: float = poll_interval
+        self.lease: float = lease
+        self.max_attempts: int = max_attempts
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str, suffix: str = "") -> str:
+        return os.path.join(self.directory, f"{job_id}.json{suffix}")
+
+    def _write(self, path: str, job: dict) -> None:
+        """Write a job file atomically, readers never see it half written."""
+        tmp_path: str = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.rename(tmp_path, path)
+
+    def put(self, job: dict) -> str:
+        job_id: str = _new_job_id()
+        self._write(self._path(job_id), job)
+        return job_id
+
+    def get(self, timeout: Optional[float] = None) -> Optional[tuple[str, dict]]:
+        deadline: Optional[float] = None if timeout is None else time.time() + timeout
+        while True:
+            self._release_expired()
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(".json"):
+                    continue
+                path: str = os.path.join(self.directory, filename)
+                try:
+                    # the lease starts now, renaming keeps the modification time
+                    os.utime(path)
+                    os.rename(path, f"{path}.claimed")
+                except FileNotFoundError:
+                    # claimed by another worker in the meantime
+                    continue
+                with open(f"{path}.claimed", "r") as f:
+                    job: dict = json.load(f)
+                return filename[: -len(".json")], {key: job[key] for key in JOB_KEYS}
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _release_expired(self) -> None:
+        """Put back the claims whose lease ran out, their worker died."""
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json.claimed"):
+                continue
+            try:
+                claimed_at: float = os.path.getmtime(
+                    os.path.join(self.directory, filename)
+                )
+            except FileNotFoundError:
+                continue
+            if claimed_at < time.time() - self.lease:
+                self.release(filename[: -len(".json.claimed")])
+
+    def ack(self, job_id: str) -> None:
+        try:
+            os.remove(self._path(job_id, ".claimed"))
+        except FileNotFoundError:
+            # the lease ran out and the job was put back on the queue
+            print(f"Job {job_id} was no longer claimed")
+
+    def fail(self, job_id: str, error: str) -> None:
+        try:
+            with open(self._path(job_id, ".claimed"), "r") as f:
+                job: dict = json.load(f)
+        except FileNotFoundError:
+            print(f"Job {job_id} was no longer claimed")
+            return
+        self._write(self._path(job_id, ".failed"), {**job, "error": error})
+        os.remove(self._path(job_id, ".claimed"))
+
+    def release(self, job_id: str) -> None:
+        releasing: str = self._path(job_id, ".releasing")
+        try:
+            # only one worker wins the rename, the others leave the job alone
+            os.rename(self._path(job_id, ".claimed"), releasing)
+        except FileNotFoundError:
+            return
+        with open(releasing, "r") as f:
+            job: dict = json.load(f)
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] >= self.max_attempts:
+            job["error"] = f"unfinished after {job['attempts']} attempts"
+            self._write(self._path(job_id, ".failed"), job)
+        else:
+            self._write(self._path(job_id), job)
+        os.remove(releasing)
+
+
+class FirestoreJobQueue:
+    """
+    Job queue backed by a Firestore collection, jobs are claimed in a transaction.
+    Job documents are named by creation time and pending jobs are taken in document
+    order, so the queries only filter on "status" and need no composite index.
+    """
+
+    def __init__(
+        self,
+        client,
+        collection: str = JOBS_COLLECTION,
+        poll_interval: float = 2,
+        lease: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> None:
+        self.client = client
+        self.collection: str = collection
+        self.poll_interval: float = poll_interval
+        self.lease: float = lease
+        self.max_attempts: int = max_attempts
+
+    def put(self, job: dict) -> str:
+        from google.cloud import firestore
+
+        job_id: str = _new_job_id()
+        self.client.collection(self.collection).document(job_id).set(
+            {
+                **job,
+                "status": "pending",
+                "attempts": 0,
+                "created": firestore.SERVER_TIMESTAMP,
+            }
+        )
+        return job_id
+
+    def get(self, timeout: Optional[float] = None) -> Optional[tuple[str, dict]]:
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def claim(transaction) -> Optional[tuple[str, dict]]:
+            pending = list(
+                self.client.collection(self.collection)
+                .where(filter=firestore.FieldFilter("status", "==", "pending"))
+                .limit(1)
+                .stream(transaction=transaction)
+            )
+            if len(pending) == 0:
+                return None
+            transaction.update(
+                pending[0].reference,
+                {"status": "claimed", "leaseExpires": time.time() + self.lease},
+            )
+            job: dict = pending[0].to_dict()
+            return pending[0].id, {key: job[key] for key in JOB_KEYS}
+
+        # claims whose lease ran out belong to a worker that died
+        for snapshot in (
+            self.client.collection(self.collection)
+            .where(filter=firestore.FieldFilter("status", "==", "claimed"))
+            .stream()
+        ):
+            if snapshot.to_dict().get("leaseExpires", 0) < time.time():
+                self._release(snapshot.id, expired_only=True)
+
+        deadline: Optional[float] = None if timeout is None else time.time() + timeout
+        while True:
+            claimed = claim(self.client.transaction())
+            if claimed is not None:
+                return claimed
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def ack(self, job_id: str) -> None:
+        self.client.collection(self.collection).document(job_id).delete()
+
+    def fail(self, job_id: str, error: str) -> None:
+        self.client.collection(self.collection).document(job_id).update(
+            {"status": "failed", "error": error}
+        )
+
+    def release(self, job_id: str) -> None:
+        self._release(job_id, expired_only=False)
+
+    def _release(self, job_id: str, expired_only: bool) -> None:
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def requeue(transaction) -> None:
+            reference = self.client.collection(self.collection).document(job_id)
+            snapshot = reference.get(transaction=transaction)
+            job: dict = snapshot.to_dict() or {}
+            # another worker may have released it in the meantime
+            if job.get("status") != "claimed":
+                return
+            if expired_only and job.get("leaseExpires", 0) >= time.time():
+                return
+            attempts: int = job.get("attempts", 0) + 1
+            if attempts >= self.max_attempts:
+                transaction.update(
+                    reference,
+                    {
+                        "status": "failed",
+                        "attempts": attempts,
+                        "error": f"unfinished after {attempts} attempts",
+                    },
+                )
+            else:
+                transaction.update(
+                    reference, {"status": "pending", "attempts": attempts}
+                )
+
+        requeue(self.client.transaction())
+
+
+def open_job_queue(spec: Optional[str] = None):
+    """
+    Open the job queue described by `spec`, or by STRIDESYNC_JOB_QUEUE if not given
+    Parameters
+    ----------
+    spec : Optional[str]
+        "memory", "file:<directory>" or "firestore" (the default)
+
+    Returns
+    -------
+    InMemoryJobQueue | FileJobQueue | FirestoreJobQueue
+        The job queue
+    """
+    if spec is None:
+        spec = os.environ.get(JOB_QUEUE_ENV, "firestore")
+    if spec == "memory":
+        return InMemoryJobQueue()
+    if spec.startswith("file:"):
+        return FileJobQueue(spec[len("file:") :])
+    if spec == "firestore":
+        from firebase_admin import firestore, get_app, initialize_app
+
+        # the trigger has initialized the app already, the worker hasn't
+        try:
+            get_app()
+        except ValueError:
+            initialize_app()
+        return FirestoreJobQueue(firestore.client())
+    raise ValueError(f"Unknown job queue {spec}")
@@ -0,0 +1,377 @@
+"""
+Description
+-----------
+Headless renderer that draws the same frames as graphical.create_video_from_file
+directly into preallocated NumPy RGB buffers and hands them straight to the video
+encoder, without a pygame display, event loop or per-frame PNG files.
+
+The geometry, cadence and pronation/supination state of every frame are computed
+for the whole run up front, the parts of a frame that never change (labels and
+indicator circles) are drawn once into a template that is copied into a batch of
+BATCH_FRAMES frames at a time, and only the moving parts are drawn per frame.
+
+pygame is only used once, to rasterize the glyphs of the fonts and to load the
+shoe sprite, so that text and sprites match the pygame backend.
+"""
+
+import os
+from typing import Final, Optional
+
+import numpy as np
+
+from graphical import (
+    LEG_LENGTH,
+    PRONATION_THRESHOLD,
+    ROTATE,
+    SAMPLING,
+    SCREEN_W,
+    X_CENTER,
+    Y_CENTER,
+)
+
+BATCH_FRAMES: Final[int] = 64
+LINE_WIDTH: Final[float] = 3
+CIRCLE_RADIUS: Final[int] = 12
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+CYAN = (0, 255, 255)
+PURPLE = (128, 0, 128)
+
+
+class NumpyRenderer:
+    """
+    Renders stick-figure frames into NumPy arrays of shape (SCREEN_W, SCREEN_W, 3).
+    A renderer holds its glyph cache, sprite and template, so it should be created
+    once and reused for every run.
+    """
+
+    def __init__(self, assets: Optional[dict] = None) -> None:
+        """
+        Parameters
+        ----------
+        assets : Optional[dict]
+            Assets from graphical.load_assets, only the fonts and the shoe sprite are
+            used. Loaded without initializing the pygame display if not given.
+        """
+        import pygame
+
+        if assets is None:
+            pygame.font.init()
+            font = pygame.font.SysFont("Arial", 24)
+            # imported here, graphical.load_assets would initialize the display
+            from graphical import shoes
+
+            shoe = pygame.transform.flip(pygame.image.load(shoes), True, False)
+            assets = {
+                "font_a": font,
+                "font_b": font,
+                "shoe": pygame.transform.scale(shoe, (40, 50)),
+            }
+        self._pygame = pygame
+        self._fonts: dict = {"a": assets["font_a"], "b": assets["font_b"]}
+        self._glyphs: dict = {}
+
+        shoe = assets["shoe"]
+        self.shoe_rgb: np.ndarray = pygame.surfarray.array3d(shoe).swapaxes(0, 1)
+        try:
+            alpha = pygame.surfarray.array_alpha(shoe).swapaxes(0, 1)
+        except ValueError:
+            alpha = np.full(self.shoe_rgb.shape[:2], 255, dtype=np.uint8)
+        self.shoe_alpha: np.ndarray = (alpha / 255.0)[:, :, None]
+
+        self.template: np.ndarray = np.zeros((SCREEN_W, SCREEN_W, 3), dtype=np.uint8)
+        # pronation/supination and overstriding labels, right aligned at x=535
+        labels = (("Pronation ", 50), ("Supination ", 80), ("Overstriding ", 110))
+        for text, y in labels:
+            image = self.render_text("a", text, WHITE, BLACK)
+            self.blit(self.template, image, 535 - image.shape[1], y)
+        for y in (70, 100, 130):
+            self.circle(self.template, 550, y, GREEN)
+
+    def render_text(
+        self, font: str, text: str, color: tuple, background: tuple
+    ) -> np.ndarray:
+        """
+        Render text from cached glyph coverages, each placed where pygame places it
+        Parameters
+        ----------
+        font : str
+            "a" or "b"
+        text : str
+            Text
+        color : tuple
+            Text color
+        background : tuple
+            Background color
+
+        Returns
+        -------
+        np.ndarray
+            RGB image of the text
+        """
+        text_font = self._fonts[font]
+        width, height = text_font.size(text)
+        coverage = np.zeros((height, width))
+        for index, char in enumerate(text):
+            x = text_font.size(text[:index])[0]
+            glyph = self._glyph(font, char)[:height, : max(width - x, 0)]
+            target = coverage[: glyph.shape[0], x : x + glyph.shape[1]]
+            np.maximum(target, glyph, out=target)
+        background = np.asarray(background, dtype=float)
+        color = np.asarray(color, dtype=float)
+        image = background + coverage[:, :, None] * (color - background)
+        return (image + 0.5).astype(np.uint8)
+
+    def _glyph(self, font: str, char: str) -> np.ndarray:
+        """Antialiased coverage of a character."""
+        key = (font, char)
+        if key not in self._glyphs:
+            surface = self._fonts[font].render(char, True, WHITE)
+            alpha = self._pygame.surfarray.array_alpha(surface).swapaxes(0, 1)
+            self._glyphs[key] = alpha / 255
+        return self._glyphs[key]
+
+    @staticmethod
+    def blit(
+        frame: np.ndarray,
+        image: np.ndarray,
+        x: float,
+        y: float,
+        alpha: Optional[np.ndarray] = None,
+    ) -> None:
+        """Copy (or alpha blend) an image onto a frame with its top left at (x, y)."""
+        x, y = int(x), int(y)
+        height, width = image.shape[:2]
+        top, left = max(y, 0), max(x, 0)
+        bottom = min(y + height, frame.shape[0])
+        right = min(x + width, frame.shape[1])
+        if top >= bottom or left >= right:
+            return
+        source = image[top - y : bottom - y, left - x : right - x]
+        if alpha is None:
+            frame[top:bottom, left:right] = source
+            return
+        weight = alpha[top - y : bottom - y, left - x : right - x]
+        target = frame[top:bottom, left:right]
+        target[:] = (source * weight + target * (1 - weight) + 0.5).astype(np.uint8)
+
+    @staticmethod
+    def line(
+        frame: np.ndarray,
+        start: tuple,
+        end: tuple,
+        color: tuple,
+        width: float = LINE_WIDTH,
+    ) -> None:
+        """Draw a line by filling the pixels within width / 2 of the segment."""
+        half = width / 2
+        x0, y0 = start
+        x1, y1 = end
+        left = max(int(np.floor(min(x0, x1) - half)), 0)
+        right = min(int(np.ceil(max(x0, x1) + half)) + 1, frame.shape[1])
+        top = max(int(np.floor(min(y0, y1) - half)), 0)
+        bottom = min(int(np.ceil(max(y0, y1) + half)) + 1, frame.shape[0])
+        if left >= right or top >= bottom:
+            return
+        ys, xs = np.mgrid[top:bottom, left:right]
+        dx, dy = x1 - x0, y1 - y0
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            t = np.zeros(xs.shape)
+        else:
+            t = np.clip(((xs - x0) * dx + (ys - y0) * dy) / length_sq, 0, 1)
+        distance_sq = (xs - (x0 + t * dx)) ** 2 + (ys - (y0 + t * dy)) ** 2
+        frame[top:bottom, left:right][distance_sq <= half * half] = color
+
+    @staticmethod
+    def circle(
+        frame: np.ndarray, x: int, y: int, color: tuple, radius: int = CIRCLE_RADIUS
+    ) -> None:
+        """Draw a filled circle, covering the same 2 * radius pixels as pygame."""
+        ys, xs = np.ogrid[-radius:radius, -radius:radius]
+        mask = (xs + 0.5) ** 2 + (ys + 0.5) ** 2 <= radius * radius
+        frame[y - radius : y + radius, x - radius : x + radius][mask] = color
+
+    def render(
+        self,
+        LS: np.ndarray,
+        LT: np.ndarray,
+        RS: np.ndarray,
+        RT: np.ndarray,
+        batch_frames: int = BATCH_FRAMES,
+        fps: float = SAMPLING,
+    ):
+        """
+        Render every frame of a run, a batch at a time
+        Parameters
+        ----------
+        LS, LT, RS, RT : np.ndarray
+            Left shank, left thigh, right shank and right thigh, shape (n, 3)
+        batch_frames : int
+            Number of frames per batch
+        fps : float
+            Frame rate of the run data
+
+        Yields
+        ------
+        np.ndarray
+            Batch of frames, shape (frames, SCREEN_W, SCREEN_W, 3). The buffer is
+            reused, so a batch must be consumed before the next one is requested.
+        """
+        LS, LT, RS, RT = (np.asarray(leg, dtype=float) for leg in (LS, LT, RS, RT))
+        n_frames: int = len(LS) - 1
+        if n_frames <= 0:
+            return
+        frames = np.arange(n_frames)
+
+        # knee and foot positions of every frame
+        l_knee = np.stack(
+            [
+                Y_CENTER + LEG_LENGTH * np.cos(LT[:n_frames, 1]),
+                X_CENTER - LEG_LENGTH * np.sin(LT[:n_frames, 1]),
+            ],
+            axis=1,
+        )
+        r_knee = np.stack(
+            [
+                Y_CENTER + LEG_LENGTH * np.cos(RT[:n_frames, 1]),
+                X_CENTER - LEG_LENGTH * np.sin(RT[:n_frames, 1]),
+            ],
+            axis=1,
+        )
+        l_shank = l_knee - LEG_LENGTH * np.stack(
+            [np.cos(LS[:n_frames, 1]), np.sin(LS[:n_frames, 1])], axis=1
+        )
+        r_shank = r_knee - LEG_LENGTH * np.stack(
+            [np.cos(RS[:n_frames, 1]), np.sin(RS[:n_frames, 1])], axis=1
+        )
+
+        # knee angles
+        l_angle = np.round(
+            np.abs(np.rad2deg(LT[:n_frames, 1])) + np.abs(np.rad2deg(LS[:n_frames, 1])),
+            2,
+        )
+        r_angle = np.round(
+            np.abs(np.rad2deg(RT[:n_frames, 1])) + np.abs(np.rad2deg(RS[:n_frames, 1])),
+            2,
+        )
+
+        # cadence - when shank_l goes pos (forward) to neg (backwards)
+        marker_ang = round(LEG_LENGTH * np.cos(LS[0][1] + ROTATE), 2)
+        shank_x = np.round(LEG_LENGTH * np.cos(LS[:, 1] + ROTATE), 2)
+        crossings = (shank_x[:-1] > marker_ang) & (shank_x[1:] < marker_ang)
+        strides = np.cumsum(crossings)
+        spm_text = ["0"] * n_frames
+        spm = "0"
+        for it in frames:
+            if crossings[it]:
+                minutes = it / fps / 60
+                spm = str(round(strides[it] / minutes, 2)) if minutes else "inf"
+            spm_text[it] = spm
+
+        # supination is outwards aka marker>vert, pronation is inwards aka marker<vert
+        marker_vert = round(np.rad2deg(RS[0][0]), 2)
+        current_vert = np.rad2deg(RS[:n_frames, 0])
+        off = np.abs(abs(marker_vert) - np.abs(current_vert)) >= PRONATION_THRESHOLD
+        supinating = (marker_vert < current_vert) & off
+        pronating = (marker_vert > current_vert) & off
+
+        center = (X_CENTER, Y_CENTER)
+        batch = np.empty((batch_frames, SCREEN_W, SCREEN_W, 3), dtype=np.uint8)
+        for first in range(0, n_frames, batch_frames):
+            count = min(batch_frames, n_frames - first)
+            batch[:count] = self.template
+            for offset in range(count):
+                it = first + offset
+                frame = batch[offset]
+                activity = round(it / fps, 2)
+                self.blit(
+                    frame,
+                    self.render_text(
+                        "b", f"Length of activity: {activity}", WHITE, BLACK
+                    ),
+                    50,
+                    50,
+                )
+                self.blit(
+                    frame,
+                    self.render_text("b", f"Cadence: {spm_text[it]} spm", WHITE, BLACK),
+                    50,
+                    80,
+                )
+                self.blit(
+                    frame,
+                    self.render_text("b", f"Left: {l_angle[it]}", BLUE, RED),
+                    50,
+                    110,
+                )
+                self.blit(
+                    frame,
+                    self.render_text("b", f"Right: {r_angle[it]}", PURPLE, GREEN),
+                    50,
+                    140,
+                )
+                self.line(frame, center, l_knee[it], CYAN)
+                self.line(frame, l_knee[it], l_shank[it], RED)
+                self.line(frame, center, r_knee[it], GREEN)
+                self.line(frame, r_knee[it], r_shank[it], PURPLE)
+                if supinating[it]:
+                    self.circle(frame, 550, 100, RED)
+                if pronating[it]:
+                    self.circle(frame, 550, 70, RED)
+                for foot in (l_shank[it], r_shank[it]):
+                    x, y = foot[0] - 30, foot[1] - 20
+                    self.blit(frame, self.shoe_rgb, x, y, self.shoe_alpha)
+            yield batch[:count]
+
+    def create_video(
+        self,
+        *,
+        LS: np.ndarray,
+        LT: np.ndarray,
+        RS: np.ndarray,
+        RT: np.ndarray,
+        video_link: str,
+        snaps_folder: str,
+        fps: float = SAMPLING,
+    ) -> str:
+        """
+        Render a run and encode its frames straight into a video
+        Parameters
+        ----------
+        LS, LT, RS, RT : np.ndarray
+            Left shank, left thigh, right shank and right thigh, shape (n, 3)
+        video_link : str
+            Path of the video to write
+        snaps_folder : str
+            Folder the first frame is saved to as 000001.png, for the thumbnail
+        fps : float
+            Frame rate of the run data and the video
+
+        Returns
+        -------
+        str
+            Video name
+        """
+        import imageio
+        from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+        os.makedirs(snaps_folder, exist_ok=True)
+        os.makedirs(os.path.dirname(video_link), exist_ok=True)
+        writer = FFMPEG_VideoWriter(
+            video_link, (SCREEN_W, SCREEN_W), fps, codec="libx264"
+        )
+        try:
+            for index, batch in enumerate(self.render(LS, LT, RS, RT, fps=fps)):
+                if index == 0:
+                    imageio.imwrite(f"{snaps_folder}/000001.png", batch[0])
+                for frame in batch:
+                    writer.write_frame(frame)
+        finally:
+            writer.close()
+        print("video released!")
+        return video_link
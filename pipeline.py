@@ -0,0 +1,230 @@
+"""
+Description
+-----------
+Processing of one queued run, run by the worker (worker.py): download the run,
+filter it, render its video and plots, upload them to storage and link them to
+the user's most recent post. Kept out of main.py so that the worker doesn't
+import the Cloud Functions entry point and the trigger doesn't load the
+rendering stack.
+
+Notes
+-----
+The Firebase app is initialized from the environment: credentials from
+GOOGLE_APPLICATION_CREDENTIALS (or the runtime's service account) and the
+default storage bucket from FIREBASE_CONFIG, e.g.
+FIREBASE_CONFIG='{"storageBucket": "<project>.appspot.com"}'.
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Final, Optional
+from datetime import datetime
+
+import google
+from firebase_admin import get_app, initialize_app, storage, firestore
+
+import filter_run_data
+import firestore_access
+import graphical
+import profiling
+from build_plots import generate_average_stride_plots, generate_cadence_plot
+from stride_analysis import run_summary
+
+# initialize firebase app, once per process
+try:
+    get_app()
+except ValueError:
+    initialize_app()
+
+# "png" (default) or "html" for interactive plots
+PLOT_FORMAT_ENV: Final[str] = "STRIDESYNC_PLOT_FORMAT"
+# "pygame" (default) or "numpy", see graphical.create_video_from_file
+RENDERER_ENV: Final[str] = "STRIDESYNC_RENDERER"
+# frame rate the runs are resampled to and rendered at, 30 by default
+FPS_ENV: Final[str] = "STRIDESYNC_FPS"
+
+
+def send_video_to_storage(userId: str, video_name: str, video_link: str) -> str:
+    """
+    Send video to storage
+    Parameters
+    ----------
+    video_link : str
+        Video link
+
+    Returns
+    -------
+    str
+        Video link
+    """
+    storage.bucket().blob(
+        f"/movies/users/{userId}/{video_name}.mp4"
+    ).upload_from_filename(video_link)
+
+    return storage.bucket().blob(f"/movies/users/{userId}/{video_name}.mp4").public_url
+
+
+def send_image_to_storage(userId: str, image_name: str, image_link: str) -> str:
+    """
+    Send image to storage
+    Parameters
+    ----------
+    image_link : str
+        Image link
+
+    Returns
+    -------
+    str
+        Image link
+    """
+    storage.bucket().blob(
+        f"/thumbnails/users/{userId}/{image_name}.png"
+    ).upload_from_filename(image_link)
+
+    return (
+        storage.bucket().blob(f"/thumbnails/users/{userId}/{image_name}.png").public_url
+    )
+
+
+def send_html_to_storage(userId: str, html_name: str, html_link: str) -> str:
+    """
+    Send html to storage
+    Parameters
+    ----------
+    html_link : str
+        html link
+
+    Returns
+    -------
+    str
+        html link
+    """
+    storage.bucket().blob(
+        f"/plots/users/{userId}/{html_name}.html"
+    ).upload_from_filename(html_link)
+
+    return storage.bucket().blob(f"/plots/users/{userId}/{html_name}.html").public_url
+
+
+def process_run(
+    userId: str,
+    bucket_name: str,
+    object_name: str,
+    workdir: str = "/tmp",
+    assets: Optional[dict] = None,
+) -> None:
+    """
+    Download a run, render its video and plots, upload them and link them to the
+    user's most recent post
+    Parameters
+    ----------
+    userId : str
+        User ID
+    bucket_name : str
+        Bucket the run was uploaded to
+    object_name : str
+        Path of the run inside the bucket
+    workdir : str
+        Folder for the intermediate files, one per concurrently processed run
+    assets : Optional[dict]
+        Warm assets from graphical.load_assets, loaded for this run if not given
+    """
+    pre_filename: str = f"{workdir}/data_pre.run"
+    data_filename: str = f"{workdir}/data.run"
+    # try to download file another way, currently getting SIGKILL
+    blob = storage.bucket(bucket_name).blob(object_name)
+    # download file
+    if os.path.exists(pre_filename):
+        os.remove(pre_filename)
+    if os.path.exists(data_filename):
+        os.remove(data_filename)
+    for folder in ("movies", "snaps", "plots"):
+        if os.path.exists(f"{workdir}/{folder}"):
+            shutil.rmtree(f"{workdir}/{folder}")
+        os.makedirs(f"{workdir}/{folder}")
+    blob.download_to_filename(pre_filename)
+
+    # look up the post to update while the run is being rendered
+    firestore_client: google.cloud.firestore.Client = firestore.client()
+    print(f"userId: {userId}")
+    lookup = ThreadPoolExecutor(max_workers=1)
+    post_future = lookup.submit(
+        firestore_access.get_latest_post, firestore_client, userId
+    )
+    lookup.shutdown(wait=False)
+
+    fps: float = float(os.environ.get(FPS_ENV, filter_run_data.TARGET_FPS))
+    with profiling.stage("filter"):
+        gap_stats: dict[str, int] = filter_run_data.filter_run_data(
+            pre_filename, data_filename, target_fps=fps
+        )
+
+    # Create video from object
+    print(f"Creating video from {object_name}...")
+    now: datetime = datetime.now()
+    date: str = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    video_link: str = f"{workdir}/movies/{date}.mp4"
+    ls, lt, rs, rt = graphical.read_file(data_filename)
+    summary: dict = {**run_summary(ls, lt, rs, rt, sampling=fps), "gaps": gap_stats}
+    with profiling.stage("rendering"):
+        graphical.create_video_from_file(
+            LS=ls,
+            LT=lt,
+            RS=rs,
+            RT=rt,
+            video_link=video_link,
+            snaps_folder=f"{workdir}/snaps",
+            assets=assets,
+            backend=os.environ.get(RENDERER_ENV, "pygame"),
+            fps=fps,
+        )
+
+    public_link: Final[str] = send_video_to_storage(userId, f"{date}", video_link)
+    # create thumbnail using first image added
+    thumbnail_link: str = f"{workdir}/snaps/000001.png"
+    # upload thumbnail to storage
+    thumbnail_public_link: Final[str] = send_image_to_storage(
+        userId, f"{date}_thumb", thumbnail_link
+    )
+
+    # most recent post of user
+    post_ref = post_future.result()
+    if post_ref is None:
+        print(f"User {userId} has no posts")
+        return
+    # generate plots for post as well
+    plot_format: str = os.environ.get(PLOT_FORMAT_ENV, "png")
+    stride_filename = f"{workdir}/plots/stride.{plot_format}"
+    cadence_filename = f"{workdir}/plots/cadence.{plot_format}"
+    with profiling.stage("plotting"):
+        generate_average_stride_plots(data_filename, stride_filename, fps=fps)
+        generate_cadence_plot(data_filename, cadence_filename, fps=fps)
+
+    # send files to storage
+    # interactive plots are rendered by the client, images are rendered here
+    send_plot_to_storage = (
+        send_html_to_storage if plot_format == "html" else send_image_to_storage
+    )
+    stride_public_link: Final[str] = send_plot_to_storage(
+        userId, f"{date}_stride", stride_filename
+    )
+    cadence_public_link: Final[str] = send_plot_to_storage(
+        userId, f"{date}_cadence", cadence_filename
+    )
+
+    # update post links and summary, increment numPosts on /users/{userId} and add
+    # the run to the user's aggregate in one batch
+    firestore_access.update_post_links(
+        firestore_client,
+        userId,
+        post_ref,
+        {
+            "videoLink": public_link,
+            "thumbnailLink": thumbnail_public_link,
+            "stridePlot": stride_public_link,
+            "cadencePlot": cadence_public_link,
+        },
+        summary=summary,
+        run_date=now,
+    )
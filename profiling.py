@@ -0,0 +1,192 @@
+"""
+Description
+-----------
+Opt-in profiling of the processing pipeline. Set STRIDESYNC_PROFILE=1 and every
+pipeline stage (filter, rendering, encoding, plotting) run inside a profiling
+session saves, next to the other outputs of the run:
+
+- <stage>.prof: cProfile stats, open with pstats or snakeviz
+- <stage>.tracemalloc: tracemalloc snapshot taken at the end of the stage
+- <stage>.txt: wall time, peak traced memory, the slowest functions and the
+  largest allocation sites
+
+A stage nested in another one (encoding inside rendering) is left out of the
+outer stage's CPU profile. Without the environment variable, sessions and
+stages cost nothing.
+
+Usage
+-----
+Profile the pipeline locally against a sample run, no Firebase needed:
+python profiling.py sample.run [output_dir] [pygame|numpy]
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from typing import Final, Optional
+
+PROFILE_ENV: Final[str] = "STRIDESYNC_PROFILE"
+TOP_N: Final[int] = 25
+
+# folder of the current session, None when not profiling
+_directory: Optional[str] = None
+# profilers of the stages currently running, innermost last
+_stack: list[dict] = []
+
+
+def enabled() -> bool:
+    """Whether profiling was turned on with STRIDESYNC_PROFILE."""
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+@contextmanager
+def session(directory: str, force: bool = False):
+    """
+    Save the profiles of the stages run inside the session to `directory`
+    Parameters
+    ----------
+    directory : str
+        Folder the profiles are saved to
+    force : bool
+        Profile even if STRIDESYNC_PROFILE isn't set
+
+    Yields
+    ------
+    Optional[str]
+        `directory`, None if not profiling
+    """
+    global _directory
+    if not (force or enabled()):
+        yield None
+        return
+    os.makedirs(directory, exist_ok=True)
+    previous, _directory = _directory, directory
+    try:
+        yield directory
+    finally:
+        _directory = previous
+        print(f"Profiles saved to {directory}")
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Profile a pipeline stage if a session is active
+    Parameters
+    ----------
+    name : str
+        Stage name, used for the file names
+    """
+    if _directory is None:
+        yield
+        return
+    directory: str = _directory
+    owns_tracing: bool = not tracemalloc.is_tracing()
+    if owns_tracing:
+        tracemalloc.start()
+    if _stack:
+        # a profiler can't run while another one is, the outer stage pauses
+        _stack[-1]["profiler"].disable()
+        # the peak is reset for this stage, the outer one keeps its peak so far
+        outer_peak: int = tracemalloc.get_traced_memory()[1]
+        _stack[-1]["peak"] = max(_stack[-1]["peak"], outer_peak)
+    tracemalloc.reset_peak()
+    current = {"profiler": cProfile.Profile(), "peak": 0}
+    _stack.append(current)
+    start: float = time.perf_counter()
+    current["profiler"].enable()
+    try:
+        yield
+    finally:
+        current["profiler"].disable()
+        elapsed: float = time.perf_counter() - start
+        peak: int = max(current["peak"], tracemalloc.get_traced_memory()[1])
+        snapshot = tracemalloc.take_snapshot()
+        _stack.pop()
+        if owns_tracing:
+            tracemalloc.stop()
+        _save(directory, name, current["profiler"], snapshot, elapsed, peak)
+        if _stack:
+            _stack[-1]["peak"] = max(_stack[-1]["peak"], peak)
+            _stack[-1]["profiler"].enable()
+
+
+def _save(
+    directory: str,
+    name: str,
+    profiler: cProfile.Profile,
+    snapshot: tracemalloc.Snapshot,
+    elapsed: float,
+    peak: int,
+) -> None:
+    """Write the profile, the snapshot and a readable report of a stage."""
+    profiler.dump_stats(f"{directory}/{name}.prof")
+    snapshot.dump(f"{directory}/{name}.tracemalloc")
+
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats("cumulative").print_stats(
+        TOP_N
+    )
+    allocations = "\n".join(
+        str(statistic) for statistic in snapshot.statistics("lineno")[:TOP_N]
+    )
+    with open(f"{directory}/{name}.txt", "w") as f:
+        f.write(f"stage: {name}\n")
+        f.write(f"wall time: {elapsed:.3f} s\n")
+        f.write(f"peak traced memory: {peak / 2**20:.1f} MiB\n\n")
+        f.write(f"largest allocation sites at the end of the stage:\n{allocations}\n\n")
+        f.write(functions.getvalue())
+    print(f"Profiled {name}: {elapsed:.3f} s, peak {peak / 2**20:.1f} MiB")
+
+
+def profile_run(run_file: str, output_dir: str, backend: str = "pygame") -> None:
+    """
+    Run the local part of the pipeline (filter, render, encode, plot) on a raw run
+    file and profile every stage, without Firebase
+    Parameters
+    ----------
+    run_file : str
+        Raw .run file
+    output_dir : str
+        Folder for the outputs and the profiles
+    backend : str
+        Renderer backend, see graphical.create_video_from_file
+    """
+    import filter_run_data
+    import graphical
+    from build_plots import generate_average_stride_plots, generate_cadence_plot
+
+    data_filename: str = f"{output_dir}/data.run"
+    os.makedirs(output_dir, exist_ok=True)
+    with session(f"{output_dir}/profiles", force=True):
+        with stage("filter"):
+            filter_run_data.filter_run_data(run_file, data_filename)
+        ls, lt, rs, rt = graphical.read_file(data_filename)
+        with stage("rendering"):
+            graphical.create_video_from_file(
+                LS=ls,
+                LT=lt,
+                RS=rs,
+                RT=rt,
+                video_link=f"{output_dir}/movies/run.mp4",
+                snaps_folder=f"{output_dir}/snaps",
+                backend=backend,
+            )
+        with stage("plotting"):
+            generate_average_stride_plots(data_filename, f"{output_dir}/stride.png")
+            generate_cadence_plot(data_filename, f"{output_dir}/cadence.png")
+
+
+if __name__ == "__main__":
+    # run through the imported module, the one the pipeline's stages see
+    import profiling
+
+    run_file: str = sys.argv[1]
+    output_dir: str = sys.argv[2] if len(sys.argv) > 2 else "/tmp/profile_run"
+    backend: str = sys.argv[3] if len(sys.argv) > 3 else "pygame"
+    profiling.profile_run(run_file, output_dir, backend)
@@ -0,0 +1,210 @@
+"""
+Description
+-----------
+Stride-ensemble analysis of filtered run data. Every stride detected in a run is
+time-normalized onto a common grid so that the whole run can be summarized with
+vectorized reductions (median and percentile bands) instead of picking a single
+representative stride. It also reduces a run to a compact summary record that is
+stored with its post.
+"""
+
+from typing import Final
+
+import numpy as np
+
+from graphical import PRONATION_THRESHOLD, ROTATE, SAMPLING
+
+STRIDE_POINTS: Final[int] = 100
+MIN_SPM: Final[float] = 30
+BAND_PERCENTILES: Final[tuple[float, float]] = (25, 75)
+SUMMARY_PERCENTILES: Final[tuple[int, ...]] = (10, 25, 50, 75, 90)
+
+
+def detect_strides(
+    lt: np.ndarray, sampling: float = SAMPLING, min_spm: float = MIN_SPM
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Detect strides as the frames where the left thigh swings from forward to backward.
+
+    Parameters
+    ----------
+    lt : np.ndarray
+        Left thigh samples, shape (n, 3)
+    sampling : float
+        Sampling rate of the samples in frames per second
+    min_spm : float
+        Strides slower than this many strides per minute are discarded
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Start and end frame index of every kept stride
+    """
+    lt = np.asarray(lt, dtype=float)
+    if len(lt) < 3:
+        empty = np.empty(0, dtype=int)
+        return empty, empty
+    transfer_x = np.cos(lt[:, 2] + ROTATE)
+    crossings = np.flatnonzero((transfer_x[:-2] > 0) & (transfer_x[1:-1] < 0))
+    starts = crossings[:-1]
+    ends = crossings[1:]
+    # a stride of `length` frames corresponds to 60 * sampling / length strides a minute
+    keep = (ends - starts) < (60 * sampling / min_spm)
+    return starts[keep], ends[keep]
+
+
+def normalize_strides(
+    signal: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    n_points: int = STRIDE_POINTS,
+) -> np.ndarray:
+    """
+    Resample every stride of a signal onto a common grid of `n_points` samples.
+
+    Parameters
+    ----------
+    signal : np.ndarray
+        One dimensional signal, shape (n,)
+    starts : np.ndarray
+        Start frame index of every stride
+    ends : np.ndarray
+        End frame index of every stride
+    n_points : int
+        Number of samples per normalized stride
+
+    Returns
+    -------
+    np.ndarray
+        Normalized strides, shape (n_strides, n_points)
+    """
+    signal = np.asarray(signal, dtype=float)
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    phase = np.linspace(0, 1, n_points)
+    positions = starts[:, None] + (ends - starts)[:, None] * phase[None, :]
+    values = np.interp(positions.ravel(), np.arange(len(signal)), signal)
+    return values.reshape(len(starts), n_points)
+
+
+def stride_ensemble(
+    ls: np.ndarray,
+    lt: np.ndarray,
+    rs: np.ndarray,
+    rt: np.ndarray,
+    n_points: int = STRIDE_POINTS,
+    percentiles: tuple[float, float] = BAND_PERCENTILES,
+    sampling: float = SAMPLING,
+) -> dict:
+    """
+    Compute the median stride and percentile bands of the thigh-minus-shank angle
+    for both legs over every stride of a run.
+
+    Parameters
+    ----------
+    ls, lt, rs, rt : np.ndarray
+        Left shank, left thigh, right shank and right thigh samples, shape (n, 3)
+    n_points : int
+        Number of samples per normalized stride
+    percentiles : tuple[float, float]
+        Lower and upper percentile of the band around the median
+    sampling : float
+        Sampling rate of the samples in frames per second
+
+    Returns
+    -------
+    dict
+        "time" (seconds over the median stride duration), "n_strides", "cadence"
+        (strides per minute of every stride) and, for "Left" and "Right", a dict with
+        the "median", "lower" and "upper" angles in radians. Empty if no strides
+        were detected.
+    """
+    ls, lt, rs, rt = (np.asarray(leg, dtype=float) for leg in (ls, lt, rs, rt))
+    starts, ends = detect_strides(lt, sampling=sampling)
+    if len(starts) == 0:
+        return {}
+
+    lengths = ends - starts
+    ensemble: dict = {
+        "time": np.linspace(0, np.median(lengths) / sampling, n_points),
+        "n_strides": len(starts),
+        "cadence": 60 * sampling / lengths,
+    }
+    for leg, thigh, shank in (("Left", lt, ls), ("Right", rt, rs)):
+        strides = normalize_strides(thigh[:, 1] - shank[:, 1], starts, ends, n_points)
+        lower, median, upper = np.percentile(
+            strides, [percentiles[0], 50, percentiles[1]], axis=0
+        )
+        ensemble[leg] = {"median": median, "lower": lower, "upper": upper}
+    return ensemble
+
+
+def count_onsets(mask: np.ndarray) -> int:
+    """Number of runs of True in a boolean array."""
+    mask = np.asarray(mask, dtype=bool)
+    if len(mask) == 0:
+        return 0
+    return int(mask[0]) + int(np.count_nonzero(mask[1:] & ~mask[:-1]))
+
+
+def run_summary(
+    ls: np.ndarray,
+    lt: np.ndarray,
+    rs: np.ndarray,
+    rt: np.ndarray,
+    sampling: float = SAMPLING,
+) -> dict:
+    """
+    Summarize a run in a record small enough to store with its post.
+
+    Parameters
+    ----------
+    ls, lt, rs, rt : np.ndarray
+        Left shank, left thigh, right shank and right thigh samples, shape (n, 3)
+    sampling : float
+        Sampling rate of the samples in frames per second
+
+    Returns
+    -------
+    dict
+        "duration" in seconds, "strides", "cadence" (strides per minute at the
+        SUMMARY_PERCENTILES, keyed "p10" etc., None without strides), "kneeAngle"
+        ("left" and "right" min and max in degrees) and "pronations" and
+        "supinations", the number of times the right shank rolled past
+        PRONATION_THRESHOLD degrees inwards or outwards.
+    """
+    ls, lt, rs, rt = (np.asarray(leg, dtype=float) for leg in (ls, lt, rs, rt))
+    starts, ends = detect_strides(lt, sampling=sampling)
+    cadence = 60 * sampling / (ends - starts)
+
+    knee_angle: dict = {}
+    for leg, thigh, shank in (("left", lt, ls), ("right", rt, rs)):
+        # knee angle as displayed in the video, see graphical.calc_angle
+        angle = np.abs(np.rad2deg(thigh[:, 1])) + np.abs(np.rad2deg(shank[:, 1]))
+        knee_angle[leg] = {
+            "min": float(angle.min()) if len(angle) else None,
+            "max": float(angle.max()) if len(angle) else None,
+        }
+
+    # supination is outwards aka marker>vert, pronation is inwards aka marker<vert
+    pronations = supinations = 0
+    if len(rs):
+        marker_vert = round(np.rad2deg(rs[0][0]), 2)
+        current_vert = np.rad2deg(rs[:, 0])
+        off = np.abs(abs(marker_vert) - np.abs(current_vert)) >= PRONATION_THRESHOLD
+        supinations = count_onsets((marker_vert < current_vert) & off)
+        pronations = count_onsets((marker_vert > current_vert) & off)
+
+    return {
+        "duration": len(lt) / sampling,
+        "strides": len(starts),
+        "cadence": {
+            f"p{percentile}": (
+                float(np.percentile(cadence, percentile)) if len(cadence) else None
+            )
+            for percentile in SUMMARY_PERCENTILES
+        },
+        "kneeAngle": knee_angle,
+        "pronations": pronations,
+        "supinations": supinations,
+    }
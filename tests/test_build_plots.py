@@ -0,0 +1,68 @@
+import numpy as np
+
+import build_plots
+from benchmarks import HEADER, synthetic_legs
+
+
+def write_run(path, frames=300):
+    np.savetxt(
+        path,
+        np.hstack(synthetic_legs(frames)),
+        delimiter=",",
+        header=HEADER,
+        comments="",
+    )
+
+
+def test_stride_band_label(tmp_path, monkeypatch):
+    write_run(tmp_path / "data.run")
+    monkeypatch.setattr(build_plots, "BAND_PERCENTILES", (10, 90))
+
+    build_plots.generate_average_stride_plots(
+        str(tmp_path / "data.run"), str(tmp_path / "stride.html")
+    )
+
+    html = (tmp_path / "stride.html").read_text()
+    assert "Left (10th-90th percentile)" in html
+    assert "25th-75th" not in html
+
+
+def test_lttb():
+    x = np.linspace(0, 100, 10_000)
+    y = np.sin(x)
+    y[6_543] = 50  # a single spike
+
+    x_out, y_out = build_plots.lttb(x, y, n_out=200)
+
+    assert len(x_out) == len(y_out) == 200
+    assert (x_out[0], y_out[0]) == (x[0], y[0])
+    assert (x_out[-1], y_out[-1]) == (x[-1], y[-1])
+    assert np.all(np.diff(x_out) > 0)
+    assert 50 in y_out
+    # every kept point is a point of the series
+    np.testing.assert_array_equal(y_out, y[np.searchsorted(x, x_out)])
+
+
+def test_lttb_short_input():
+    x, y = np.arange(5.0), np.arange(5.0) ** 2
+
+    x_out, y_out = build_plots.lttb(x, y, n_out=10)
+
+    np.testing.assert_array_equal(x_out, x)
+    np.testing.assert_array_equal(y_out, y)
+
+
+def test_write_figure_html(tmp_path):
+    import plotly.graph_objects as go
+
+    figure = go.Figure(data=[go.Scatter(x=[0, 1, 2], y=[3, 1, 2], name="series")])
+
+    # an .html file must not go through the image exporter
+    figure.write_image = None
+
+    build_plots.write_figure(figure, str(tmp_path / "plot.html"))
+
+    assert [path.name for path in tmp_path.iterdir()] == ["plot.html"]
+    html = (tmp_path / "plot.html").read_text()
+    assert "<html>" in html
+    assert '"name":"series"' in html
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from filter_run_data import (
+    COLUMN_NAMES,
+    TIMESTAMP_COLUMN,
+    filter_run_data,
+    read_raw_run,
+)
+
+HEADER = ",".join(COLUMN_NAMES)
+
+
+def write_run(path, values, timestamps=None):
+    header = HEADER
+    if timestamps is not None:
+        header = f"{HEADER},{TIMESTAMP_COLUMN}"
+        values = np.column_stack([values, timestamps])
+    lines = [",".join("" if np.isnan(v) else f"{v:.6f}" for v in row) for row in values]
+    path.write_text("\n".join([header, *lines]) + "\n")
+
+
+def filter_file(tmp_path, **kwargs):
+    gap_stats = filter_run_data(
+        str(tmp_path / "data_pre.run"), str(tmp_path / "data.run"), **kwargs
+    )
+    filtered = np.loadtxt(tmp_path / "data.run", delimiter=",", skiprows=1)
+    return filtered, gap_stats
+
+
+def test_extra_field_on_first_row(tmp_path):
+    row = ",".join(str(value / 10) for value in range(12))
+    run_file = tmp_path / "data_pre.run"
+    run_file.write_text(f"{HEADER}\n{row},9\n{row}\n")
+
+    values, timestamps = read_raw_run(str(run_file))
+
+    assert timestamps is None
+    np.testing.assert_allclose(values, np.tile(np.arange(12) / 10, (2, 1)))
+
+
+def test_long_gap_keeps_time_axis(tmp_path):
+    # 20 s of a slow ramp at the sensor rate with a 2 s dropout in every channel
+    t = np.arange(300) / 15
+    values = np.tile(0.05 * t[:, None], (1, 12))
+    values[150:180] = np.nan
+    write_run(tmp_path / "data_pre.run", values)
+
+    filtered, gap_stats = filter_file(tmp_path, target_fps=30)
+
+    assert gap_stats["dropped_rows"] == 30
+    # the run still lasts 20 s and its samples stay at their time
+    assert abs(len(filtered) / 30 - len(t) / 15) < 0.1
+    frame = 30 * 15  # 15 s, after the dropout
+    assert abs(filtered[frame, 0] - 0.05 * 15) < 0.02
+
+
+@pytest.mark.parametrize("target_fps", [10, 60])
+def test_frame_count_follows_target_fps(tmp_path, target_fps):
+    t = np.arange(300) / 15
+    write_run(tmp_path / "data_pre.run", np.tile(0.05 * t[:, None], (1, 12)))
+
+    filtered, _ = filter_file(tmp_path, target_fps=target_fps)
+
+    assert abs(len(filtered) - len(t) / 15 * target_fps) <= 2
+    frame = 10 * target_fps  # 10 s
+    assert abs(filtered[frame, 0] - 0.05 * 10) < 0.02
+
+
+def test_jittered_timestamps(tmp_path):
+    # 20 s at roughly 50 Hz, every sample up to 4 ms early or late
+    rng = np.random.default_rng(0)
+    exact = np.arange(1000) / 50
+    jittered = exact + rng.uniform(-0.004, 0.004, len(exact))
+
+    filtered = []
+    for t in (exact, jittered):
+        values = np.tile(np.sin(2 * np.pi * 0.2 * t)[:, None], (1, 12))
+        write_run(tmp_path / "data_pre.run", values, timestamps=t)
+        filtered.append(filter_file(tmp_path, target_fps=30)[0])
+
+    assert abs(len(filtered[1]) - 20 * 30) <= 1
+    # the jitter is resampled away, the frames match those of a steady sensor
+    n = min(len(frames) for frames in filtered)
+    np.testing.assert_allclose(filtered[1][:n], filtered[0][:n], atol=0.02)
+
+
+def test_gap_across_wrap_is_filled_the_short_way(tmp_path):
+    # an angle turning from 2.8 rad through pi to -2 rad, with the samples around
+    # the wrap missing
+    angle = (2.8 + 0.01 * np.arange(150) + np.pi) % (2 * np.pi) - np.pi
+    values = np.tile(angle[:, None], (1, 12))
+    crossing = int(np.flatnonzero(np.diff(angle) < 0)[0])
+    values[crossing - 1 : crossing + 3] = np.nan
+    write_run(tmp_path / "data_pre.run", values)
+
+    filtered, gap_stats = filter_file(tmp_path, target_fps=30)
+
+    assert gap_stats["filled_values"] == 4 * 12
+    # the angle stays near the wrap instead of dipping through 0
+    assert np.abs(filtered[:, 0]).min() > 1.9
@@ -0,0 +1,193 @@
+from datetime import datetime
+
+from google.cloud import firestore
+
+import firestore_access
+
+
+class FakeDocument:
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeSnapshot:
+    def __init__(self, reference):
+        self.reference = reference
+
+
+class FakeQuery:
+    """Records the query chain and streams the documents it was built with."""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.calls = []
+
+    def order_by(self, field, direction=None):
+        self.calls.append(("order_by", field, direction))
+        return self
+
+    def limit(self, count):
+        self.calls.append(("limit", count))
+        return self
+
+    def select(self, fields):
+        self.calls.append(("select", fields))
+        return self
+
+    def stream(self):
+        documents = self.client.posts.get(self.path, [])
+        return [FakeSnapshot(FakeDocument(path)) for path in documents]
+
+
+class FakeBatch:
+    def __init__(self):
+        self.writes = []
+        self.committed = False
+
+    def update(self, reference, fields):
+        self.writes.append(("update", reference.path, fields, None))
+
+    def set(self, reference, fields, merge=False):
+        self.writes.append(("set", reference.path, fields, merge))
+
+    def commit(self):
+        self.committed = True
+
+
+class FakeClient:
+    """The part of firestore.Client the access layer uses, kept in memory."""
+
+    def __init__(self, posts=None):
+        # collection path -> document paths, most recent first
+        self.posts = posts or {}
+        self.queries = []
+        self.batches = []
+
+    def collection(self, path):
+        query = FakeQuery(self, path)
+        self.queries.append(query)
+        return query
+
+    def document(self, path):
+        return FakeDocument(path)
+
+    def batch(self):
+        batch = FakeBatch()
+        self.batches.append(batch)
+        return batch
+
+
+LINKS = {
+    "videoLink": "https://example.com/run.mp4",
+    "thumbnailLink": "https://example.com/run_thumb.png",
+    "stridePlot": "https://example.com/run_stride.png",
+    "cadencePlot": "https://example.com/run_cadence.png",
+}
+
+
+def test_get_latest_post_returns_most_recent():
+    client = FakeClient(
+        {"users/u1/posts": ["users/u1/posts/newest", "users/u1/posts/older"]}
+    )
+
+    post_ref = firestore_access.get_latest_post(client, "u1")
+
+    assert post_ref.path == "users/u1/posts/newest"
+    (query,) = client.queries
+    assert query.path == "users/u1/posts"
+    assert ("order_by", "datePosted", firestore.Query.DESCENDING) in query.calls
+    assert ("limit", 1) in query.calls
+
+
+def test_get_latest_post_without_posts():
+    assert firestore_access.get_latest_post(FakeClient(), "u1") is None
+
+
+def test_update_post_links_writes_one_batch():
+    client = FakeClient()
+    post_ref = FakeDocument("users/u1/posts/p1")
+
+    firestore_access.update_post_links(client, "u1", post_ref, LINKS)
+
+    (batch,) = client.batches
+    assert batch.committed
+    assert len(batch.writes) == 2
+    assert batch.writes[0] == ("update", "users/u1/posts/p1", LINKS, None)
+    kind, path, fields, merge = batch.writes[1]
+    assert (kind, path, merge) == ("set", "users/u1", True)
+    assert list(fields) == ["numPosts"]
+    assert isinstance(fields["numPosts"], firestore.Increment)
+    assert fields["numPosts"].value == 1
+
+
+SUMMARY = {
+    "duration": 600.0,
+    "strides": 700,
+    "cadence": {"p10": 66.0, "p25": 68.0, "p50": 70.0, "p75": 72.0, "p90": 74.0},
+    "kneeAngle": {
+        "left": {"min": 12.5, "max": 98.0},
+        "right": {"min": None, "max": None},
+    },
+    "pronations": 3,
+    "supinations": 1,
+}
+
+
+def test_update_post_links_with_summary():
+    client = FakeClient()
+    post_ref = FakeDocument("users/u1/posts/p1")
+    run_date = datetime(2024, 12, 30)
+
+    firestore_access.update_post_links(
+        client, "u1", post_ref, LINKS, summary=SUMMARY, run_date=run_date
+    )
+
+    (batch,) = client.batches
+    assert batch.committed
+    assert [write[:2] for write in batch.writes] == [
+        ("update", "users/u1/posts/p1"),
+        ("set", "users/u1"),
+        ("set", "users/u1/aggregates/runs"),
+    ]
+    assert batch.writes[0][2] == {**LINKS, "summary": SUMMARY}
+    _, _, fields, merge = batch.writes[2]
+    assert merge
+    assert fields == firestore_access.aggregate_update(SUMMARY, run_date)
+
+
+def test_aggregate_update():
+    # 30 December 2024 belongs to the first ISO week of 2025
+    update = firestore_access.aggregate_update(SUMMARY, datetime(2024, 12, 30))
+
+    totals = {
+        "runs": firestore.Increment(1),
+        "duration": firestore.Increment(600.0),
+        "strides": firestore.Increment(700),
+        "pronations": firestore.Increment(3),
+        "supinations": firestore.Increment(1),
+    }
+    assert update == {
+        **totals,
+        # legs without samples are left out
+        "kneeAngle": {
+            "left": {"min": firestore.Minimum(12.5), "max": firestore.Maximum(98.0)}
+        },
+        "weeks": {
+            "2025-W01": {
+                **totals,
+                "cadenceSum": firestore.Increment(70.0),
+                "cadenceRuns": firestore.Increment(1),
+            }
+        },
+    }
+
+
+def test_aggregate_update_without_cadence():
+    summary = {**SUMMARY, "cadence": dict.fromkeys(SUMMARY["cadence"])}
+
+    update = firestore_access.aggregate_update(summary, datetime(2024, 3, 4))
+
+    week = update["weeks"]["2024-W10"]
+    assert "cadenceSum" not in week and "cadenceRuns" not in week
+    assert week["runs"] == firestore.Increment(1)
@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+
+from benchmarks import HEADER
+from graphical import parse_run
+
+ROW = ",".join(str(value) for value in range(12))
+
+
+def parse(*lines):
+    return parse_run(io.StringIO("\n".join([HEADER, *lines]) + "\n"))
+
+
+def assert_rows(legs, rows):
+    expected = np.tile(np.arange(12, dtype=float), (rows, 1))
+    np.testing.assert_array_equal(np.hstack(legs), expected)
+
+
+def test_parse_run():
+    assert_rows(parse(ROW, ROW), 2)
+
+
+def test_extra_field_on_first_row():
+    assert_rows(parse(f"{ROW},99", ROW, ROW), 3)
+
+
+def test_trailing_commas():
+    assert_rows(parse(f"{ROW},", f"{ROW},"), 2)
+
+
+def test_bad_rows_are_dropped():
+    short = ",".join(str(value) for value in range(11))
+    assert_rows(parse(ROW, short, "", ROW.replace("5", "x"), ROW), 2)
+
+
+def test_empty_run():
+    ls, lt, rs, rt = parse()
+    assert ls.shape == lt.shape == rs.shape == rt.shape == (0, 3)
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from job_queue import FileJobQueue, InMemoryJobQueue
+
+JOB = {"userId": "u1", "bucket": "bucket", "name": "runs/u1/run.run"}
+
+
+@pytest.fixture(params=["memory", "file"])
+def make_queue(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return InMemoryJobQueue(**kwargs)
+        return FileJobQueue(str(tmp_path), poll_interval=0.01, **kwargs)
+
+    return make
+
+
+def test_ack_removes_job(make_queue):
+    job_queue = make_queue()
+    job_queue.put(JOB)
+    job_id, job = job_queue.get(timeout=0)
+    assert job == JOB
+    job_queue.ack(job_id)
+    assert job_queue.get(timeout=0) is None
+
+
+def test_expired_claim_is_put_back(make_queue):
+    job_queue = make_queue(lease=0)
+    job_queue.put(JOB)
+    first_id, _ = job_queue.get(timeout=0)
+    # the first claim is never finished, as if its worker died
+    second_id, job = job_queue.get(timeout=0)
+    assert (second_id, job) == (first_id, JOB)
+
+
+def test_released_too_often_is_failed(make_queue):
+    job_queue = make_queue(max_attempts=2)
+    job_queue.put(JOB)
+    job_id, _ = job_queue.get(timeout=0)
+    job_queue.release(job_id)
+    assert job_queue.get(timeout=0)[0] == job_id
+    job_queue.release(job_id)
+    assert job_queue.get(timeout=0) is None
+
+
+def test_failed_job_is_kept(tmp_path):
+    job_queue = FileJobQueue(str(tmp_path))
+    job_queue.put(JOB)
+    job_id, _ = job_queue.get(timeout=0)
+    job_queue.fail(job_id, "ValueError('bad run')")
+    assert os.listdir(tmp_path) == [f"{job_id}.json.failed"]
+    with open(tmp_path / f"{job_id}.json.failed") as f:
+        assert json.load(f) == {**JOB, "error": "ValueError('bad run')"}
+    assert job_queue.get(timeout=0) is None
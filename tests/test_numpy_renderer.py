@@ -0,0 +1,54 @@
+import numpy as np
+import pygame
+
+import graphical
+from benchmarks import synthetic_legs
+from numpy_renderer import NumpyRenderer
+
+FRAMES = 48
+
+
+def write_sprite(path):
+    """Half-transparent shoe-sized sprite, the real one isn't in the repository."""
+    sprite = pygame.Surface((80, 100), pygame.SRCALPHA)
+    sprite.fill((0, 0, 0, 0))
+    pygame.draw.ellipse(sprite, (200, 120, 40, 255), (0, 30, 80, 40))
+    pygame.draw.rect(sprite, (40, 120, 200, 128), (20, 0, 40, 40))
+    pygame.image.save(sprite, str(path))
+
+
+def test_frames_match_pygame(tmp_path, monkeypatch):
+    write_sprite(tmp_path / "shoe.png")
+    monkeypatch.setattr(graphical, "shoes", str(tmp_path / "shoe.png"))
+    ls, lt, rs, rt = synthetic_legs(FRAMES)
+    assets = graphical.load_assets()
+    # compare the frames the pygame backend saves, not the encoded video
+    monkeypatch.setattr(graphical, "create_video", lambda *args, **kwargs: None)
+    graphical.create_video_from_file(
+        LS=ls,
+        LT=lt,
+        RS=rs,
+        RT=rt,
+        video_link=f"{tmp_path}/movies/run.mp4",
+        snaps_folder=f"{tmp_path}/snaps",
+        assets=assets,
+    )
+
+    differences = []
+    for batch_start, batch in zip(
+        range(0, FRAMES, 16),
+        NumpyRenderer(assets).render(ls, lt, rs, rt, batch_frames=16),
+    ):
+        for offset, frame in enumerate(batch):
+            snap = pygame.image.load(
+                f"{tmp_path}/snaps/%06d.png" % (batch_start + offset + 1)
+            )
+            expected = pygame.surfarray.array3d(snap).swapaxes(0, 1)
+            differences.append(
+                np.abs(frame.astype(int) - expected.astype(int)).max(axis=2)
+            )
+
+    differences = np.stack(differences)
+    assert len(differences) == FRAMES
+    assert differences.mean() < 2
+    assert np.mean(differences > 64) < 0.01
@@ -0,0 +1,32 @@
+import profiling
+
+
+def peak_mib(report):
+    for line in report.read_text().splitlines():
+        if line.startswith("peak traced memory:"):
+            return float(line.split()[3])
+
+
+def test_nested_stage_keeps_outer_peak(tmp_path):
+    with profiling.session(str(tmp_path), force=True):
+        with profiling.stage("rendering"):
+            frames = bytearray(64 * 2**20)
+            del frames
+            with profiling.stage("encoding"):
+                chunk = bytearray(4 * 2**20)
+                del chunk
+
+    assert 60 < peak_mib(tmp_path / "rendering.txt") < 70
+    assert 3 < peak_mib(tmp_path / "encoding.txt") < 10
+    for name in ("rendering", "encoding"):
+        assert (tmp_path / f"{name}.prof").exists()
+        assert (tmp_path / f"{name}.tracemalloc").exists()
+
+
+def test_disabled_without_env(tmp_path, monkeypatch):
+    monkeypatch.delenv(profiling.PROFILE_ENV, raising=False)
+    with profiling.session(str(tmp_path / "profiles")) as directory:
+        with profiling.stage("filter"):
+            pass
+    assert directory is None
+    assert not (tmp_path / "profiles").exists()
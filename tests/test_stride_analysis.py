@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+
+from graphical import PRONATION_THRESHOLD
+from stride_analysis import (
+    count_onsets,
+    detect_strides,
+    normalize_strides,
+    run_summary,
+    stride_ensemble,
+)
+
+SAMPLING = 30
+STRIDE_FRAMES = 30
+
+
+def steady_run(strides=10, stride_frames=STRIDE_FRAMES):
+    """Legs of a run whose left thigh swings back once every `stride_frames`."""
+    frames = np.arange(strides * stride_frames)
+    # cos(lt_z + ROTATE) = -sin(lt_z) turns negative at every multiple of a stride
+    phase = 2 * np.pi * frames / stride_frames + 0.1
+    ls, lt, rs, rt = (np.zeros((len(frames), 3)) for _ in range(4))
+    lt[:, 2] = phase
+    lt[:, 1] = np.deg2rad(40)
+    ls[:, 1] = np.deg2rad(-20)
+    rt[:, 1] = np.deg2rad(np.linspace(0, 30, len(frames)))
+    rs[:, 1] = np.deg2rad(10)
+    return ls, lt, rs, rt
+
+
+def swing_phase(stride_lengths):
+    """Left thigh z angle swinging back once at the start of every stride."""
+    return np.concatenate(
+        [
+            2 * np.pi * (k + (np.arange(length) + 0.5) / length)
+            for k, length in enumerate(stride_lengths)
+        ]
+    )
+
+
+def test_detect_strides():
+    lt = np.zeros((300, 3))
+    lt[:, 2] = swing_phase([30] * 10)
+
+    starts, ends = detect_strides(lt, sampling=SAMPLING)
+
+    # a stride runs from one swing back to the next, the last one is left open
+    np.testing.assert_array_equal(starts, 30 * np.arange(1, 9) - 1)
+    np.testing.assert_array_equal(ends - starts, [30] * 8)
+
+
+def test_detect_strides_drops_slow_strides():
+    # 60, 60, 20 (a stop) and 60 strides per minute
+    lengths = [30, 30, 30, 90, 30, 30]
+    lt = np.zeros((sum(lengths), 3))
+    lt[:, 2] = swing_phase(lengths)
+
+    starts, ends = detect_strides(lt, sampling=SAMPLING, min_spm=30)
+
+    np.testing.assert_array_equal(ends - starts, [30, 30, 30])
+    assert len(detect_strides(lt, sampling=SAMPLING, min_spm=70)[0]) == 0
+
+
+def test_normalize_strides():
+    signal = np.arange(100, dtype=float) ** 2
+    starts, ends = np.array([10, 40]), np.array([20, 80])
+
+    strides = normalize_strides(signal, starts, ends, n_points=11)
+
+    assert strides.shape == (2, 11)
+    np.testing.assert_allclose(strides[0], np.arange(10, 21) ** 2)
+    np.testing.assert_allclose(strides[1], np.arange(40, 81, 4) ** 2)
+
+
+def test_stride_ensemble():
+    ls, lt, rs, rt = steady_run()
+    frames = np.arange(len(lt))
+    # every stride bends the knee by a half sine, each stride by a different amount
+    amplitudes = np.array([0, 0.2, 0.9, 0.4, 0.6, 0.1, 0.8, 0.3, 0.5, 0, 0])
+    stride = (frames + 1) // STRIDE_FRAMES
+    shape = np.sin(np.pi * ((frames + 1) % STRIDE_FRAMES) / STRIDE_FRAMES)
+    lt[:, 1] = amplitudes[stride] * shape
+    rt[:, 1] = 2 * amplitudes[stride] * shape
+    ls[:, 1] = rs[:, 1] = 0
+
+    ensemble = stride_ensemble(
+        ls, lt, rs, rt, n_points=31, percentiles=(25, 75), sampling=SAMPLING
+    )
+
+    assert ensemble["n_strides"] == 8
+    np.testing.assert_allclose(ensemble["cadence"], 60)
+    np.testing.assert_allclose(ensemble["time"], np.linspace(0, 1, 31))
+    # strides 1 to 8 are detected, their amplitudes give the median and the band
+    kept = amplitudes[1:9]
+    expected_shape = np.sin(np.pi * np.arange(31) / STRIDE_FRAMES)
+    for leg, scale in (("Left", 1), ("Right", 2)):
+        for key, percentile in (("lower", 25), ("median", 50), ("upper", 75)):
+            np.testing.assert_allclose(
+                ensemble[leg][key],
+                scale * np.percentile(kept, percentile) * expected_shape,
+                atol=1e-12,
+            )
+
+
+def test_stride_ensemble_without_strides():
+    legs = [np.zeros((90, 3)) for _ in range(4)]
+    assert stride_ensemble(*legs, sampling=SAMPLING) == {}
+
+
+def test_count_onsets():
+    mask = np.array([1, 1, 0, 1, 0, 0, 1, 1, 1], dtype=bool)
+    assert count_onsets(mask) == 3
+    assert count_onsets(~mask) == 2
+    assert count_onsets(np.zeros(0, dtype=bool)) == 0
+    assert count_onsets(np.zeros(5, dtype=bool)) == 0
+
+
+def test_run_summary():
+    ls, lt, rs, rt = steady_run()
+    # the right shank rolls outwards once and inwards twice past the threshold
+    roll = np.zeros(len(rs))
+    roll[40:50] = PRONATION_THRESHOLD + 5
+    roll[100:110] = -(PRONATION_THRESHOLD + 5)
+    roll[200:205] = -(PRONATION_THRESHOLD + 5)
+    roll[250:260] = PRONATION_THRESHOLD - 5  # not past the threshold
+    rs[:, 0] = np.deg2rad(roll)
+
+    summary = run_summary(ls, lt, rs, rt, sampling=SAMPLING)
+
+    assert summary["duration"] == pytest.approx(10)
+    # the first swing back starts the first stride, the last one ends the last
+    assert summary["strides"] == 8
+    for percentile in ("p10", "p25", "p50", "p75", "p90"):
+        assert summary["cadence"][percentile] == pytest.approx(60)
+    assert summary["kneeAngle"]["left"] == pytest.approx({"min": 60, "max": 60})
+    assert summary["kneeAngle"]["right"] == pytest.approx({"min": 10, "max": 40})
+    assert summary["supinations"] == 1
+    assert summary["pronations"] == 2
+
+
+def test_run_summary_without_strides():
+    ls, lt, rs, rt = (np.zeros((90, 3)) for _ in range(4))
+
+    summary = run_summary(ls, lt, rs, rt, sampling=SAMPLING)
+
+    assert summary["duration"] == pytest.approx(3)
+    assert summary["strides"] == 0
+    assert set(summary["cadence"].values()) == {None}
+    assert (summary["pronations"], summary["supinations"]) == (0, 0)
+
+
+def test_run_summary_of_empty_run():
+    empty = np.zeros((0, 3))
+
+    summary = run_summary(empty, empty, empty, empty, sampling=SAMPLING)
+
+    assert summary["kneeAngle"] == {
+        "left": {"min": None, "max": None},
+        "right": {"min": None, "max": None},
+    }
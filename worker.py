@@ -0,0 +1,185 @@
+"""
+Description
+-----------
+Long-lived worker that processes the runs queued by the `create_video` storage
+trigger. Runs are processed concurrently in a pool of processes; every process
+loads its engines (pygame fonts and sprites, the plot exporter) once and reuses
+them for every run it processes. At most `max_pending` runs are taken off the
+queue at a time, the rest stay on the queue until a process frees up.
+
+A run that raises is marked failed on the queue and not retried. A pool process
+that dies, e.g. killed for running out of memory, breaks the pool: its runs are
+put back on the queue (and failed after job_queue.MAX_ATTEMPTS tries) and the
+pool is restarted.
+
+Usage
+-----
+python worker.py --queue file:/tmp/jobs --workers 2
+"""
+
+import os
+import shutil
+import argparse
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Final, Optional
+
+import profiling
+from job_queue import open_job_queue
+
+WORKDIR: Final[str] = "/tmp/worker"
+
+# engines of the current pool process, set by _init_engines
+_assets: Optional[dict] = None
+
+
+def _init_engines() -> None:
+    """Load the engines of a pool process once, before its first run."""
+    global _assets
+    import graphical
+    import build_plots
+
+    _assets = graphical.load_assets()
+    build_plots.warm_plot_exporter()
+
+
+def _process_job(job_id: str, job: dict, workdir: str) -> None:
+    """Process one queued run in a pool process, in its own working folder."""
+    # imported here so that pipeline's initialize_app runs once per pool process
+    import pipeline
+
+    # profiles are kept next to the working folders, which are removed after the run
+    try:
+        with profiling.session(f"{workdir}/profiles/{job_id}"):
+            pipeline.process_run(
+                job["userId"],
+                job["bucket"],
+                job["name"],
+                workdir=f"{workdir}/{job_id}",
+                assets=_assets,
+            )
+    finally:
+        shutil.rmtree(f"{workdir}/{job_id}", ignore_errors=True)
+
+
+def serve(
+    job_queue,
+    workers: int = 2,
+    max_pending: Optional[int] = None,
+    workdir: str = WORKDIR,
+    stop_when_idle: bool = False,
+    poll_timeout: float = 5,
+) -> None:
+    """
+    Take runs off the queue and process them until interrupted
+    Parameters
+    ----------
+    job_queue : InMemoryJobQueue | FileJobQueue | FirestoreJobQueue
+        Queue to take runs from
+    workers : int
+        Number of runs processed at the same time
+    max_pending : Optional[int]
+        Number of runs taken off the queue but not finished yet, 2 * workers if not given
+    workdir : str
+        Folder holding the working folder of every run
+    stop_when_idle : bool
+        Return once the queue is empty and every run is finished
+    poll_timeout : float
+        Seconds to wait for a new run before checking whether to stop
+    """
+    if max_pending is None:
+        max_pending = 2 * workers
+    os.makedirs(workdir, exist_ok=True)
+    slots = threading.BoundedSemaphore(max_pending)
+
+    def start_pool() -> ProcessPoolExecutor:
+        # pygame and kaleido don't survive being forked
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_engines,
+        )
+
+    def finished(job_id: str, future: Future) -> None:
+        error: Optional[BaseException] = future.exception()
+        try:
+            if error is None:
+                job_queue.ack(job_id)
+            elif isinstance(error, BrokenProcessPool):
+                # the process of this run or of another one died, try again later
+                print(f"Job {job_id} was interrupted by a dead pool process")
+                job_queue.release(job_id)
+            else:
+                print(f"Job {job_id} failed:")
+                traceback.print_exception(error)
+                # kept on the queue for inspection, a broken run file would loop
+                # forever
+                job_queue.fail(job_id, repr(error))
+        except Exception:
+            # the claim runs out and the job is put back on the queue
+            print(f"Could not update job {job_id} on the queue:")
+            traceback.print_exc()
+        finally:
+            # a lost slot would eventually block the worker for good
+            slots.release()
+
+    pool = start_pool()
+
+    try:
+        while True:
+            # backpressure: don't take a run off the queue until there is room for it
+            slots.acquire()
+            claimed = job_queue.get(timeout=poll_timeout)
+            if claimed is None:
+                slots.release()
+                if stop_when_idle and _idle(slots, max_pending):
+                    break
+                continue
+            job_id, job = claimed
+            print(f"Processing job {job_id}: {job['name']}")
+            try:
+                future = pool.submit(_process_job, job_id, job, workdir)
+            except BrokenProcessPool:
+                print("A pool process died, restarting the pool")
+                pool.shutdown(wait=True)
+                pool = start_pool()
+                future = pool.submit(_process_job, job_id, job, workdir)
+            future.add_done_callback(
+                lambda future, job_id=job_id: finished(job_id, future)
+            )
+    finally:
+        pool.shutdown(wait=True)
+
+
+def _idle(slots: threading.BoundedSemaphore, max_pending: int) -> bool:
+    """Whether no run is being processed, i.e. every slot is free."""
+    taken: int = 0
+    while taken < max_pending and slots.acquire(blocking=False):
+        taken += 1
+    for _ in range(taken):
+        slots.release()
+    return taken == max_pending
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued StrideSync runs")
+    parser.add_argument(
+        "--queue", default=None, help='"memory", "file:<directory>" or "firestore"'
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=None)
+    parser.add_argument("--workdir", default=WORKDIR)
+    parser.add_argument(
+        "--once", action="store_true", help="exit once the queue is drained"
+    )
+    args = parser.parse_args()
+    serve(
+        open_job_queue(args.queue),
+        workers=args.workers,
+        max_pending=args.max_pending,
+        workdir=args.workdir,
+        stop_when_idle=args.once,
+    )